@@ -4,25 +4,113 @@ Excel 转换器抽象基类
 """
 
 import re
+import zlib
 from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass, field
 from datetime import datetime
+from enum import StrEnum
+from functools import lru_cache
 from pathlib import Path
 
 import openpyxl
 from loguru import logger
+from lxml import etree
+from openpyxl.cell.cell import TYPE_FORMULA
+from openpyxl.cell.read_only import EMPTY_CELL
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.xml.constants import SHEET_MAIN_NS
 
 from .models import MergedCellInfo
 
+_MERGE_CELL_TAG = f"{{{SHEET_MAIN_NS}}}mergeCell"
+_ROW_TAG = f"{{{SHEET_MAIN_NS}}}row"
+_FORMULA_TAG = f"{{{SHEET_MAIN_NS}}}f"
+_VALUE_TAG = f"{{{SHEET_MAIN_NS}}}v"
+
+# 输出文件写缓冲（1 MiB），大 sheet 的输出合并为少量系统调用
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# 标记单元格不在任何合并区域内（合并区域的值本身可能为 None）
+_NOT_MERGED = object()
+
+# 数字格式
+_PERCENT_DECIMALS_RE = re.compile(r"0\.(0+)%")
+_SCIENTIFIC_DECIMALS_RE = re.compile(r"0\.(0+)E", re.IGNORECASE)
+_DECIMALS_RE = re.compile(r"0\.(0+)")
+
+# 注释行前缀（str.startswith 接受元组，一次调用完成全部匹配）
+_NOTE_PREFIXES = (
+    "注", "备注", "说明", "注意", "*", "※", "●", "◆", "△", "▲",
+    "[注", "（注", "(注",
+)
+
+# 注释解析
+_NOTE_SPLIT_RE = re.compile(r"(?=\[注[\d、,，]+\]|\[备注\d*\]|\[说明\d*\])")
+_NOTE_MULTI_NUM_RE = re.compile(r"^\[(注)([\d、,，]+)\]")
+_NOTE_BRACKET_RE = re.compile(r"^\[([注备说][注明意]?\d*)\]")
+_NOTE_PAREN_RE = re.compile(r"^[（\(]([注备说][注明意]?\d*)[）\)]")
+_NOTE_PLAIN_RE = re.compile(r"^(注\d*|备注\d*|说明\d*|注意\d*)[：:．.、]?\s*")
+_NOTE_NUM_SEP_RE = re.compile(r"[、,，]")
+
+# 注释引用
+_REF_MULTI_RE = re.compile(r"\[(注)([\d、,，]+)\]")
+_REF_BRACKET_RE = re.compile(r"\[(注\d*|备注\d*|说明\d*|注意\d*)\]")
+_REF_SUPERSCRIPT_RE = re.compile(r"[^\[](注\d+)(?:[：:）\)]|$|\s)")
+
+
+class _NumberKind(StrEnum):
+    """数字格式类别"""
+
+    PLAIN = "plain"
+    PERCENT = "percent"
+    SCIENTIFIC = "scientific"
+    CURRENCY = "currency"
+
+
+@lru_cache(maxsize=256)
+def _parse_number_format(number_format: str) -> tuple[_NumberKind, int, str]:
+    """解析数字格式为 (类别, 小数位数, 货币符号)，同一格式串只解析一次"""
+    if "%" in number_format:
+        match = _PERCENT_DECIMALS_RE.search(number_format)
+        return _NumberKind.PERCENT, len(match.group(1)) if match else 0, ""
+
+    if "E" in number_format.upper() and number_format != "General":
+        match = _SCIENTIFIC_DECIMALS_RE.search(number_format)
+        return _NumberKind.SCIENTIFIC, len(match.group(1)) if match else 2, ""
+
+    if "#,##" in number_format or ",0" in number_format:
+        match = _DECIMALS_RE.search(number_format)
+        decimals = len(match.group(1)) if match else 0
+        if "¥" in number_format or "￥" in number_format:
+            symbol = "¥"
+        elif "$" in number_format:
+            symbol = "$"
+        else:
+            symbol = ""
+        return _NumberKind.CURRENCY, decimals, symbol
+
+    return _NumberKind.PLAIN, 0, ""
+
 
 @dataclass
 class BaseExcelConverter(ABC):
     """Excel 转换器抽象基类"""
 
     keywords: list[str] | None = None
-    _merged_info: dict[tuple[int, int], MergedCellInfo] = field(
+    # 保留公式原文；默认读取缓存的计算结果，跳过公式解析，速度更快
+    keep_formulas: bool = False
+    # 合并区域左上角单元格 -> 合并信息
+    _merged_origins: dict[tuple[int, int], MergedCellInfo] = field(
         default_factory=dict, init=False, repr=False
     )
+    # 被合并区域覆盖的其余单元格 -> 左上角单元格的值
+    _merged_covered: dict[tuple[int, int], str | None] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _rows: list[tuple] = field(default_factory=list, init=False, repr=False)
+    # 当前工作簿路径，合并区域 XML 扫描失败时用于完整模式重新加载
+    _source_path: Path | None = field(default=None, init=False, repr=False)
 
     # ===== 模板方法 =====
     def convert(self, excel_path: Path, output_path: Path | None = None) -> Path | None:
@@ -35,18 +123,24 @@ class BaseExcelConverter(ABC):
 
         out_path = self._determine_output_path(source_path, output_path)
         filename = source_path.name
+        self._source_path = source_path
 
         logger.info(f"正在处理: {filename}")
         self._log_features()
 
         try:
-            workbook = openpyxl.load_workbook(str(source_path), data_only=False)
+            # 只读模式按需流式解析，不为每个单元格构建完整对象
+            workbook = openpyxl.load_workbook(
+                str(source_path), data_only=not self.keep_formulas, read_only=True
+            )
         except Exception as e:
             logger.error(f"解析失败: {e}")
             return None
 
-        content = self._convert_workbook(workbook, filename)
-        return self._write_output(out_path, content)
+        try:
+            return self._write_output(out_path, self._convert_workbook(workbook, filename))
+        finally:
+            workbook.close()
 
     def _determine_output_path(self, source_path: Path, output_path: Path | None) -> Path:
         """确定输出路径"""
@@ -64,28 +158,31 @@ class BaseExcelConverter(ABC):
             features += " | 关键词 ✗"
         logger.info(f"增强功能: {features}")
 
-    def _convert_workbook(self, workbook, filename: str) -> str:
-        """转换整个工作簿"""
-        sheet_contents = []
+    def _convert_workbook(self, workbook, filename: str) -> Iterator[str]:
+        """逐个 sheet 转换工作簿"""
         for sheet in workbook.worksheets:
-            if sheet.max_row == 0 or sheet.max_column == 0:
+            merged_ranges = self._read_merged_ranges(sheet)
+            self._rows = self._load_rows(sheet, merged_ranges)
+            if not self._rows:
                 continue
-            self._merged_info = self._extract_merged_cells(sheet)
-            header_rows = self._detect_header_rows(sheet)
-            flattened_headers = self._build_flattened_headers(sheet, header_rows)
-            footer_notes, data_end_row = self._detect_footer_notes(sheet, header_rows)
+            self._extract_merged_cells(merged_ranges)
+            header_rows = self._detect_header_rows()
+            flattened_headers = self._build_flattened_headers(header_rows)
+            footer_notes, data_end_row = self._detect_footer_notes(header_rows)
             
-            content = self._format_sheet(
-                sheet, filename, flattened_headers, header_rows, data_end_row
+            yield self._format_sheet(
+                sheet, filename, flattened_headers, header_rows, data_end_row, footer_notes
             )
-            sheet_contents.append(content)
-        
-        return self._join_sheets(sheet_contents)
 
-    def _write_output(self, out_path: Path, content: str) -> Path | None:
-        """写入输出文件"""
+    def _write_output(self, out_path: Path, sheet_contents: Iterable[str]) -> Path | None:
+        """写入输出文件（每个 sheet 生成后立即写入，不拼接整个文档）"""
+        separator = self._get_sheet_separator()
         try:
-            out_path.write_text(content, encoding="utf-8")
+            with out_path.open("w", encoding="utf-8", buffering=_WRITE_BUFFER_SIZE) as f:
+                for index, content in enumerate(sheet_contents):
+                    if index:
+                        f.write(separator)
+                    f.write(content)
             logger.info(f"转换成功！输出: {out_path.absolute()}")
             return out_path
         except OSError as e:
@@ -94,83 +191,197 @@ class BaseExcelConverter(ABC):
 
 
     # ===== 共享实现 =====
-    def _extract_merged_cells(self, sheet) -> dict[tuple[int, int], MergedCellInfo]:
-        """获取所有合并单元格的信息"""
-        merged_info: dict[tuple[int, int], MergedCellInfo] = {}
+    @property
+    def _max_row(self) -> int:
+        """当前 sheet 的行数"""
+        return len(self._rows)
+
+    @property
+    def _max_col(self) -> int:
+        """当前 sheet 的列数"""
+        return len(self._rows[0]) if self._rows else 0
+
+    def _cell(self, row_idx: int, col_idx: int):
+        """按 1 起始的行列号取单元格"""
+        return self._rows[row_idx - 1][col_idx - 1]
+
+    def _merged_value(self, row_idx: int, col_idx: int) -> str | None | object:
+        """合并区域内单元格取左上角的值，不在合并区域内返回 _NOT_MERGED"""
+        key = (row_idx, col_idx)
+        info = self._merged_origins.get(key)
+        if info:
+            return info.value
+        return self._merged_covered.get(key, _NOT_MERGED)
+
+    def _read_merged_ranges(self, sheet) -> list[CellRange]:
+        """读取合并区域（只读模式下 openpyxl 不解析 mergeCells，需单独扫描 XML）"""
+        if hasattr(sheet, "merged_cells"):
+            return list(sheet.merged_cells.ranges)
+        try:
+            ranges, uncached = self._scan_sheet_xml(sheet)
+        except (AttributeError, etree.XMLSyntaxError) as e:
+            logger.warning(f"sheet '{sheet.title}' 合并区域扫描失败，改用完整模式读取: {e}")
+            ranges, uncached = self._load_sheet_fully(sheet.title)
+        if uncached:
+            logger.warning(
+                f"sheet '{sheet.title}' 有 {uncached} 个公式单元格没有缓存的计算值，"
+                "输出为空；请使用 --keep-formulas 输出公式原文"
+            )
+        return ranges
+
+    def _scan_sheet_xml(self, sheet) -> tuple[list[CellRange], int]:
+        """流式扫描 sheet XML，返回 (mergeCell 合并区域, 无缓存值的公式单元格数)"""
+        # 读取缓存值时才需要检查公式；保留公式原文时不投递 f 节点
+        tags = (_ROW_TAG, _MERGE_CELL_TAG)
+        if not self.keep_formulas:
+            tags += (_FORMULA_TAG,)
+        ranges: list[CellRange] = []
+        uncached = 0
+        row_has_formula = False
+        with sheet._get_source() as source:
+            # row 解析后立即释放，避免整张表驻留内存
+            for _, element in etree.iterparse(source, tag=tags):
+                if element.tag == _FORMULA_TAG:
+                    row_has_formula = True
+                    continue
+                if element.tag == _MERGE_CELL_TAG:
+                    ranges.append(CellRange(element.get("ref")))
+                elif row_has_formula:
+                    uncached += self._count_uncached_formulas(element)
+                    row_has_formula = False
+                element.clear(keep_tail=True)
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+        return ranges, uncached
+
+    def _count_uncached_formulas(self, row) -> int:
+        """统计一行中没有缓存计算值的公式单元格（openpyxl 保存的文件写入空的 <v/>）"""
+        count = 0
+        for cell in row:
+            if cell.find(_FORMULA_TAG) is None:
+                continue
+            value = cell.find(_VALUE_TAG)
+            if value is None or (not value.text and cell.get("t") != "str"):
+                count += 1
+        return count
+
+    def _load_sheet_fully(self, title: str) -> tuple[list[CellRange], int]:
+        """以非只读模式重新加载工作簿，返回 (合并区域, 无缓存值的公式单元格数)"""
+        # 不取缓存值加载，公式单元格的 data_type 才是公式；合并区域与 data_only 无关
+        workbook = openpyxl.load_workbook(str(self._source_path), read_only=False)
+        try:
+            worksheet = workbook[title]
+            ranges = list(worksheet.merged_cells.ranges)
+            formula_cells: list[str] = []
+            if not self.keep_formulas:
+                formula_cells = [
+                    cell.coordinate
+                    for row in worksheet.iter_rows()
+                    for cell in row
+                    if cell.data_type == TYPE_FORMULA
+                ]
+        finally:
+            workbook.close()
+        if not formula_cells:
+            return ranges, 0
+        return ranges, self._count_uncached_cells(title, formula_cells)
+
+    def _count_uncached_cells(self, title: str, coordinates: list[str]) -> int:
+        """统计指定单元格中没有缓存计算值的数量（仅扫描失败的回退路径使用）"""
+        workbook = openpyxl.load_workbook(str(self._source_path), data_only=True, read_only=False)
+        try:
+            worksheet = workbook[title]
+            return sum(1 for coordinate in coordinates if worksheet[coordinate].value is None)
+        finally:
+            workbook.close()
+
+    def _load_rows(self, sheet, merged_ranges: list[CellRange]) -> list[tuple]:
+        """单次遍历读取整个 sheet，生成按合并区域补齐的矩形单元格矩阵"""
+        if hasattr(sheet, "reset_dimensions"):
+            # 只读模式依赖文件声明的尺寸，部分生成工具写得不准确
+            sheet.reset_dimensions()
+        rows = [tuple(row) for row in sheet.iter_rows()]
+
+        # 去掉只有行属性、没有任何单元格的尾部行
+        while rows and not rows[-1]:
+            rows.pop()
+
+        max_row = max([len(rows), *(r.max_row for r in merged_ranges)])
+        max_col = max([0, *(len(row) for row in rows), *(r.max_col for r in merged_ranges)])
+        rows.extend(() for _ in range(len(rows), max_row))
+
+        return [
+            row + (EMPTY_CELL,) * (max_col - len(row)) if len(row) < max_col else row
+            for row in rows
+        ]
+
+    def _extract_merged_cells(self, merged_ranges: list[CellRange]) -> None:
+        """获取所有合并单元格的信息（左上角与被覆盖单元格分开存放）"""
+        origins: dict[tuple[int, int], MergedCellInfo] = {}
+        covered: dict[tuple[int, int], str | None] = {}
 
-        for merged_range in sheet.merged_cells.ranges:
+        for merged_range in merged_ranges:
             min_row, min_col = merged_range.min_row, merged_range.min_col
             max_row, max_col = merged_range.max_row, merged_range.max_col
-            origin_value = sheet.cell(row=min_row, column=min_col).value
+            origin_value = self._cell(min_row, min_col).value
+            value = str(origin_value) if origin_value is not None else None
 
-            rowspan = max_row - min_row + 1
-            colspan = max_col - min_col + 1
-
-            for r in range(min_row, max_row + 1):
-                for c in range(min_col, max_col + 1):
-                    is_origin = r == min_row and c == min_col
-                    merged_info[(r, c)] = MergedCellInfo(
-                        value=str(origin_value) if origin_value is not None else None,
-                        rowspan=rowspan if is_origin else 0,
-                        colspan=colspan if is_origin else 0,
-                        is_origin=is_origin,
-                        skip=not is_origin,
-                    )
+            covered.update(
+                ((r, c), value)
+                for r in range(min_row, max_row + 1)
+                for c in range(min_col, max_col + 1)
+            )
+            del covered[(min_row, min_col)]
+
+            origins[(min_row, min_col)] = MergedCellInfo(
+                value=value,
+                rowspan=max_row - min_row + 1,
+                colspan=max_col - min_col + 1,
+                is_origin=True,
+                skip=False,
+            )
 
-        return merged_info
+        self._merged_origins = origins
+        self._merged_covered = covered
 
-    def _detect_header_rows(self, sheet, max_check_rows: int = 5) -> int:
+    def _detect_header_rows(self, max_check_rows: int = 5) -> int:
         """检测表头行数"""
         header_rows = 1
+        last_check_row = min(max_check_rows, self._max_row)
 
-        for row_idx in range(1, min(max_check_rows + 1, sheet.max_row + 1)):
-            has_colspan = False
-            for col_idx in range(1, sheet.max_column + 1):
-                info = self._merged_info.get((row_idx, col_idx))
-                if info and info.colspan > 1:
-                    has_colspan = True
-                    break
-
-            if has_colspan:
+        # 只有合并区域左上角带 colspan，直接遍历合并区域即可
+        for (row_idx, _), info in self._merged_origins.items():
+            if row_idx <= last_check_row and info.colspan > 1:
                 header_rows = max(header_rows, row_idx + 1)
 
-        return min(header_rows, sheet.max_row)
+        return min(header_rows, self._max_row)
 
-    def _build_flattened_headers(self, sheet, header_rows: int) -> dict[int, str]:
+    def _build_flattened_headers(self, header_rows: int) -> dict[int, str]:
         """构建降维后的表头"""
         if header_rows <= 1:
-            return self._build_single_row_headers(sheet)
-        return self._build_multi_row_headers(sheet, header_rows)
+            return self._build_single_row_headers()
+        return self._build_multi_row_headers(header_rows)
 
-    def _build_single_row_headers(self, sheet) -> dict[int, str]:
+    def _build_single_row_headers(self) -> dict[int, str]:
         """构建单行表头"""
         headers = {}
-        for col_idx in range(1, sheet.max_column + 1):
-            value = sheet.cell(row=1, column=col_idx).value
+        for col_idx, cell in enumerate(self._rows[0], start=1):
+            value = cell.value
             headers[col_idx] = str(value) if value else f"列{col_idx}"
         return headers
 
-    def _build_multi_row_headers(self, sheet, header_rows: int) -> dict[int, str]:
-        """构建多行表头（降维）"""
-        col_values: dict[int, list[str]] = {col: [] for col in range(1, sheet.max_column + 1)}
-
-        for row_idx in range(1, header_rows + 1):
-            for col_idx in range(1, sheet.max_column + 1):
-                info = self._merged_info.get((row_idx, col_idx))
-                if info:
-                    value = info.value
-                    col_values[col_idx].append(str(value) if value else "")
-                else:
-                    cell = sheet.cell(row=row_idx, column=col_idx)
-                    col_values[col_idx].append(self._format_cell_value(cell))
-
+    def _build_multi_row_headers(self, header_rows: int) -> dict[int, str]:
+        """构建多行表头（降维）：按列转置表头区域，逐列拼接去重后的各级标题"""
         headers = {}
-        for col_idx, values in col_values.items():
-            unique_values = []
-            for v in values:
-                v = v.strip()
-                if v and (not unique_values or v != unique_values[-1]):
-                    unique_values.append(v)
+        for col_idx, col_cells in enumerate(zip(*self._rows[:header_rows], strict=True), start=1):
+            unique_values: list[str] = []
+            for row_idx, cell in enumerate(col_cells, start=1):
+                value = self._merged_value(row_idx, col_idx)
+                if value is _NOT_MERGED:
+                    value = self._format_cell_value(cell)
+                value = (value or "").strip()
+                if value and (not unique_values or value != unique_values[-1]):
+                    unique_values.append(value)
             headers[col_idx] = "-".join(unique_values) if unique_values else f"列{col_idx}"
 
         return headers
@@ -189,6 +400,10 @@ class BaseExcelConverter(ABC):
         if not isinstance(value, (int, float)):
             return str(value)
 
+        # 绝大多数数字单元格是常规格式，无需解析格式串
+        if number_format == "General":
+            return self._format_plain_number(value)
+
         return self._format_number(value, number_format)
 
     def _format_datetime(self, value: datetime, number_format: str) -> str:
@@ -199,107 +414,167 @@ class BaseExcelConverter(ABC):
 
     def _format_number(self, value: int | float, number_format: str) -> str:
         """格式化数字"""
-        if "%" in number_format:
-            return self._format_percentage(value, number_format)
-
-        if "E" in number_format.upper() and number_format != "General":
-            return self._format_scientific(value, number_format)
-
-        if "#,##" in number_format or ",0" in number_format:
-            return self._format_currency(value, number_format)
-
-        if isinstance(value, float) and value == int(value):
+        kind, decimals, symbol = _parse_number_format(number_format)
+        match kind:
+            case _NumberKind.PERCENT:
+                return f"{value * 100:.{decimals}f}%"
+            case _NumberKind.SCIENTIFIC:
+                return f"{value:.{decimals}E}"
+            case _NumberKind.CURRENCY:
+                return f"{symbol}{value:,.{decimals}f}"
+        return self._format_plain_number(value)
+
+    def _format_plain_number(self, value: int | float) -> str:
+        """常规格式数字：整数值的浮点数去掉 .0"""
+        if isinstance(value, float) and value.is_integer():
             return str(int(value))
         return str(value)
 
-    def _format_percentage(self, value: float, number_format: str) -> str:
-        """格式化百分比"""
-        decimal_match = re.search(r"0\.(0+)%", number_format)
-        decimals = len(decimal_match.group(1)) if decimal_match else 0
-        return f"{value * 100:.{decimals}f}%"
-
-    def _format_scientific(self, value: float, number_format: str) -> str:
-        """格式化科学计数法"""
-        decimal_match = re.search(r"0\.(0+)E", number_format, re.IGNORECASE)
-        decimals = len(decimal_match.group(1)) if decimal_match else 2
-        return f"{value:.{decimals}E}"
-
-    def _format_currency(self, value: float, number_format: str) -> str:
-        """格式化货币"""
-        decimal_match = re.search(r"0\.(0+)", number_format)
-        decimals = len(decimal_match.group(1)) if decimal_match else 0
-        formatted = f"{value:,.{decimals}f}"
-        if "¥" in number_format or "￥" in number_format:
-            return f"¥{formatted}"
-        elif "$" in number_format:
-            return f"${formatted}"
-        return formatted
-
-    def _detect_footer_notes(self, sheet, header_rows: int) -> tuple[list[str], int]:
+    def _detect_footer_notes(self, header_rows: int) -> tuple[list[str], int]:
         """检测表格末尾的注释行"""
         notes: list[str] = []
-        note_patterns = [
-            "注", "备注", "说明", "注意", "*", "※", "●", "◆", "△", "▲",
-            "[注", "（注", "(注",
-        ]
+        wide_threshold = self._max_col // 2
 
-        for row_idx in range(sheet.max_row, header_rows, -1):
-            content, is_note = self._check_note_row(sheet, row_idx, note_patterns)
+        # 从末行向上扫描到表头为止
+        row_indices = range(self._max_row, header_rows, -1)
+        for row_idx, row in zip(row_indices, reversed(self._rows[header_rows:]), strict=True):
+            content, is_note = self._check_note_row(row_idx, row, wide_threshold)
 
             if not content:
                 continue
 
             if is_note:
-                notes.insert(0, content)
+                notes.append(content)
             else:
                 break
 
-        data_end_row = sheet.max_row - len(notes)
+        # 自下而上收集，恢复为表格中的顺序
+        notes.reverse()
+        data_end_row = self._max_row - len(notes)
         return notes, data_end_row
 
-    def _check_note_row(self, sheet, row_idx: int, note_patterns: list[str]) -> tuple[str, bool]:
+    def _check_note_row(self, row_idx: int, row: tuple, wide_threshold: int) -> tuple[str, bool]:
         """检查是否为注释行"""
         filled_cols = 0
         content = ""
         is_merged_wide = False
 
-        for col_idx in range(1, sheet.max_column + 1):
-            info = self._merged_info.get((row_idx, col_idx))
-            cell = sheet.cell(row=row_idx, column=col_idx)
+        for col_idx, cell in enumerate(row, start=1):
+            key = (row_idx, col_idx)
+            info = self._merged_origins.get(key)
 
-            if info and info.is_origin and info.colspan > sheet.max_column // 2:
+            if info and info.colspan > wide_threshold:
                 is_merged_wide = True
                 content = info.value if info.value else ""
                 break
 
-            if info and info.skip:
+            if key in self._merged_covered:
                 continue
 
             if cell.value:
                 filled_cols += 1
                 if not content:
                     content = str(cell.value)
+                # 超过 2 列有值的行不可能是注释行，无需继续扫描
+                if filled_cols > 2:
+                    return content.strip(), False
 
         content = content.strip()
         if not content:
             return "", False
 
         is_note = is_merged_wide or (
-            filled_cols <= 2 and any(content.startswith(p) for p in note_patterns)
+            filled_cols <= 2 and content.startswith(_NOTE_PREFIXES)
         )
 
         return content, is_note
 
-    def _get_row_values(self, sheet, row_idx: int) -> list[str]:
+    def _classify_notes(
+        self, footer_notes: list[str], header_text: str
+    ) -> tuple[dict[str, str], dict[str, str]]:
+        """将注释分为表头注释（每个 chunk 都带）和条件注释（按引用匹配）"""
+        notes_dict, unclassified = self._parse_notes_with_keys(footer_notes)
+        header_note_refs = self._extract_note_references(header_text)
+        header_notes = {k: v for k, v in notes_dict.items() if k in header_note_refs}
+        conditional_notes = {k: v for k, v in notes_dict.items() if k not in header_note_refs}
+        # 无编号的注释不会被任何单元格引用，视为整表说明随表头注释一起分发
+        header_notes.update(
+            (f"note-{zlib.crc32(note.encode()):08x}", note) for note in unclassified
+        )
+        return header_notes, conditional_notes
+
+    def _parse_notes_with_keys(self, notes_list: list[str]) -> tuple[dict[str, str], list[str]]:
+        """解析注释列表，返回 (按编号索引的注释, 无法识别编号的注释)"""
+        notes_dict: dict[str, str] = {}
+        unclassified: list[str] = []
+        for note in notes_list:
+            note = note.strip()
+            if not note:
+                continue
+            parts = [p.strip() for p in _NOTE_SPLIT_RE.split(note) if p.strip()]
+            if len(parts) > 1:
+                for part in parts:
+                    self._parse_single_note(part, notes_dict, unclassified)
+            else:
+                self._parse_single_note(note, notes_dict, unclassified)
+        return notes_dict, unclassified
+
+    def _parse_single_note(
+        self, note: str, notes_dict: dict[str, str], unclassified: list[str]
+    ) -> None:
+        """解析单个注释"""
+        note = note.strip()
+        if not note:
+            return
+        multi_num_match = _NOTE_MULTI_NUM_RE.match(note)
+        if multi_num_match:
+            prefix = multi_num_match.group(1)
+            nums = _NOTE_NUM_SEP_RE.split(multi_num_match.group(2))
+            for num in nums:
+                num = num.strip()
+                if num:
+                    notes_dict[f"{prefix}{num}"] = note
+            return
+        bracket_match = _NOTE_BRACKET_RE.match(note) or _NOTE_PAREN_RE.match(note)
+        if bracket_match:
+            notes_dict[bracket_match.group(1)] = note
+            return
+        plain_match = _NOTE_PLAIN_RE.match(note)
+        if plain_match:
+            notes_dict[plain_match.group(1)] = note
+            return
+        if note[0] in "*※●◆△▲":
+            notes_dict[note[0]] = note
+            return
+        unclassified.append(note)
+
+    def _extract_note_references(self, text: str) -> set[str]:
+        """从文本中提取注释引用"""
+        refs: set[str] = set()
+        # 所有文字引用都含"注"或"说明"，绝大多数单元格可直接跳过正则扫描
+        if "注" in text or "说明" in text:
+            for prefix, nums_str in _REF_MULTI_RE.findall(text):
+                for num in _NOTE_NUM_SEP_RE.split(nums_str):
+                    num = num.strip()
+                    if num:
+                        refs.add(f"{prefix}{num}")
+            refs.update(_REF_BRACKET_RE.findall(text))
+            refs.update(_REF_SUPERSCRIPT_RE.findall(text))
+        if "*" in text:
+            refs.add("*")
+        if "※" in text:
+            refs.add("※")
+        return refs
+
+    def _get_row_values(self, row_idx: int, row: tuple) -> list[str]:
         """获取一行的所有值（处理合并单元格）"""
         values = []
-        for col_idx in range(1, sheet.max_column + 1):
-            info = self._merged_info.get((row_idx, col_idx))
-            if info:
-                values.append(info.value or "")
-            else:
-                cell = sheet.cell(row=row_idx, column=col_idx)
+        for col_idx, cell in enumerate(row, start=1):
+            value = self._merged_value(row_idx, col_idx)
+            if value is _NOT_MERGED:
                 values.append(self._format_cell_value(cell))
+            else:
+                values.append(value or "")
         return values
 
 
@@ -317,11 +592,12 @@ class BaseExcelConverter(ABC):
         flattened_headers: dict[int, str],
         header_rows: int,
         data_end_row: int,
+        footer_notes: list[str],
     ) -> str:
         """格式化单个 sheet 为目标格式"""
         ...
 
     @abstractmethod
-    def _join_sheets(self, sheet_contents: list[str]) -> str:
-        """合并多个 sheet 的内容"""
+    def _get_sheet_separator(self) -> str:
+        """返回 sheet 之间的分隔文本"""
         ...
@@ -4,127 +4,183 @@ HTML 切分器模块
 """
 
 import copy
+import html
 import json
 import re
 from dataclasses import dataclass, field
 
-import tiktoken
-from bs4 import BeautifulSoup
+from lxml import etree
 
 from ..models import ChunkConfig, ChunkResult, ChunkStats, ChunkWarning, SplitMode, TokenStrategy
+from ..tokenizer import estimate_tokens, estimate_tokens_batch
 
 # 类型别名
 type RowList = list
 type NotesDict = dict[str, str]
 
+# 注释引用
+_REF_MULTI_RE = re.compile(r"\[(注)([\d、,，]+)\]")
+_REF_NUM_SEP_RE = re.compile(r"[、,，]")
+_REF_BRACKET_RE = re.compile(r"\[(注\s*\d*|备注\s*\d*|说明\s*\d*|注意\s*\d*)\s*\]")
+_REF_SUPERSCRIPT_RE = re.compile(r"[^\[](注\d+)(?:[：:）\)]|$|\s)")
+
+# 进程内共用的 HTML 解析器：普通 etree 节点，不走 lxml.html 的 HtmlElement 类查找
+# 字节输入按 UTF-8 解析（与转换器写出的编码一致）
+_HTML_PARSER = etree.HTMLParser(encoding="utf-8")
+# 节点文本（与 HtmlElement.text_content 一致）
+_TEXT_CONTENT = etree.XPath("string()")
+
+# 按 class 查找全局资产（与 CSS 类选择器语义一致）
+_FIND_CONTEXT_DIV = etree.XPath(
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' rag-context ')]"
+)
+_FIND_NOTES_META = etree.XPath(
+    "//script[contains(concat(' ', normalize-space(@class), ' '), ' table-notes-meta ')]"
+)
+
+
+def _new_element(tag: str, attrs) -> etree._Element:
+    """创建节点，属性按名称排序，chunk 内容与源属性顺序无关"""
+    return etree.Element(tag, dict(sorted(attrs.items())))
+
+
+def _to_html(element) -> str:
+    """序列化单个节点（不含其后的尾随文本）"""
+    return etree.tostring(element, encoding="unicode", method="html", with_tail=False)
+
+
+@dataclass(frozen=True, slots=True)
+class _ContextTemplate:
+    """预序列化的上下文 div，按 chunk 追加注释文本"""
+
+    html: str
+    open_tag: str
+    text: str
+    close_tag: str
+
+    def render(self, matched_notes: list[str]) -> str:
+        """生成带注释的上下文 HTML"""
+        if not matched_notes:
+            return self.html
+        notes_text = " | ".join(matched_notes)
+        suffix = html.escape(f" 【表格注释】{notes_text}", quote=False)
+        return f"{self.open_tag}{self.text}{suffix}{self.close_tag}"
+
 
 @dataclass
 class HtmlChunker:
     """HTML 切分器"""
 
     config: ChunkConfig
-    _tokenizer: tiktoken.Encoding | None = field(default=None, init=False, repr=False)
+    # 命中的条件注释键集合 -> 注释开销 token 数
+    _notes_overhead_cache: dict[frozenset[str], int] = field(
+        default_factory=dict, init=False, repr=False
+    )
 
-    def chunk(self, html_content: str) -> ChunkResult:
+    def chunk(self, html_content: str | bytes) -> ChunkResult:
         """执行切分"""
-        soup = BeautifulSoup(html_content, "html.parser")
-
-        # 提取全局资产
-        context_div = self._extract_context_div(soup)
-        header_notes, conditional_notes = self._extract_notes_meta(soup)
+        self._notes_overhead_cache.clear()
+        # lxml 在 C 中完成解析、查找和序列化，不构建 Python 对象树
+        root = etree.fromstring(html_content, _HTML_PARSER)
+        if root is None:
+            return self._single_chunk_result(html_content)
 
         # 提取表格组件
-        original_table = soup.find("table")
-        if not original_table:
+        original_table = next(root.iter("table"), None)
+        if original_table is None:
             return self._single_chunk_result(html_content)
 
-        caption = original_table.find("caption")
+        # 提取全局资产
+        context_div = self._extract_context_div(root, original_table)
+        header_notes, conditional_notes = self._extract_notes_meta(root)
+
+        caption = original_table.find(".//caption")
         header_rows = self._extract_header_rows(original_table)
         data_rows = self._extract_data_rows(original_table, header_rows)
 
         # 规范化合并单元格
-        header_rows = self._normalize_table_spans(header_rows, soup)
-        data_rows = self._normalize_table_spans(data_rows, soup)
-
-        # 计算固定开销
-        base_overhead = self._calculate_base_overhead(context_div, caption, header_rows)
-        header_text = " ".join(str(row) for row in header_rows)
+        header_rows = self._normalize_table_spans(header_rows)
+        data_rows = self._normalize_table_spans(data_rows)
+
+        # 固定部分只序列化一次，开销计算、引用提取和 chunk 拼接共用
+        context = self._serialize_context(context_div) if context_div is not None else None
+        caption_html = _to_html(caption) if caption is not None else ""
+        header_strs = [_to_html(row) for row in header_rows]
+
+        base_overhead = self._calculate_base_overhead(context, caption_html, header_strs)
+        # 无注释的表格不需要任何引用提取
+        has_notes = bool(header_notes or conditional_notes)
+        header_refs = (
+            self._extract_note_references(" ".join(header_strs)) if has_notes else set()
+        )
+        table_head = self._serialize_table_head(original_table, caption_html, header_strs)
 
         # 执行切分
         chunks, warnings, token_counts = self._split_rows(
             data_rows,
-            context_div,
-            caption,
-            header_rows,
-            original_table,
+            context,
+            table_head,
             header_notes,
             conditional_notes,
-            header_text,
+            header_refs,
             base_overhead,
         )
 
         stats = self._build_stats(token_counts, warnings, base_overhead)
         return ChunkResult(chunks=chunks, warnings=warnings, stats=stats)
 
-    def _get_tokenizer(self) -> tiktoken.Encoding:
-        """懒加载 tokenizer"""
-        if self._tokenizer is None:
-            self._tokenizer = tiktoken.get_encoding("cl100k_base")
-        return self._tokenizer
-
-    def _estimate_tokens(self, text: str) -> int:
-        """计算 token 数量"""
-        return len(self._get_tokenizer().encode(text))
-
-    def _extract_context_div(self, soup: BeautifulSoup):
+    def _extract_context_div(self, root, table):
         """提取上下文 div"""
-        context_div = soup.find("div", class_="rag-context")
-        if not context_div:
-            table_node = soup.find("table")
-            if table_node and table_node.find_previous_sibling("div"):
-                context_div = table_node.find_previous_sibling("div")
-        return context_div
-
-    def _extract_notes_meta(self, soup: BeautifulSoup) -> tuple[NotesDict, NotesDict]:
+        context_divs = _FIND_CONTEXT_DIV(root)
+        if context_divs:
+            return context_divs[0]
+        previous_divs = table.xpath("preceding-sibling::div[1]")
+        return previous_divs[0] if previous_divs else None
+
+    def _extract_notes_meta(self, root) -> tuple[NotesDict, NotesDict]:
         """提取注释元数据"""
-        notes_meta_script = soup.find("script", class_="table-notes-meta")
+        notes_meta_scripts = _FIND_NOTES_META(root)
         header_notes: NotesDict = {}
         conditional_notes: NotesDict = {}
 
-        if notes_meta_script:
+        if notes_meta_scripts:
             try:
-                notes_meta = json.loads(notes_meta_script.string)
+                notes_meta = json.loads(notes_meta_scripts[0].text)
                 header_notes = notes_meta.get("header_notes", {})
                 conditional_notes = notes_meta.get("conditional_notes", {})
-            except (json.JSONDecodeError, AttributeError):
+            except (json.JSONDecodeError, TypeError):
                 pass
 
         return header_notes, conditional_notes
 
     def _extract_header_rows(self, table) -> RowList:
         """提取表头行"""
-        thead = table.find("thead")
-        if thead:
-            return thead.find_all("tr")
-        return table.find_all("tr")[:1]
+        thead = table.find(".//thead")
+        if thead is not None:
+            return list(thead.iter("tr"))
+        # 无 thead 时首行即表头，只取第一个 tr，不展开全部行
+        first_row = next(table.iter("tr"), None)
+        return [first_row] if first_row is not None else []
 
     def _extract_data_rows(self, table, header_rows: RowList) -> RowList:
         """提取数据行（排除注释行）"""
-        tbody = table.find("tbody")
-        if tbody:
-            all_body_rows = tbody.find_all("tr")
-            return [row for row in all_body_rows if "table-note-row" not in row.get("class", [])]
+        tbody = table.find(".//tbody")
+        if tbody is not None:
+            return [
+                row for row in tbody.iter("tr")
+                if "table-note-row" not in row.get("class", "").split()
+            ]
 
-        all_rows = table.find_all("tr")
-        return [row for row in all_rows if row not in header_rows]
+        header_set = set(header_rows)
+        return [row for row in table.iter("tr") if row not in header_set]
 
-    def _normalize_table_spans(self, rows: RowList, soup: BeautifulSoup) -> RowList:
+    def _normalize_table_spans(self, rows: RowList) -> RowList:
         """处理表格的 rowspan/colspan，展开合并单元格"""
         if not rows:
             return []
 
         occupied = self._build_occupied_matrix(rows)
-        return self._rebuild_rows(rows, occupied, soup)
+        return self._rebuild_rows(rows, occupied)
 
     def _build_occupied_matrix(self, rows: RowList) -> dict:
         """构建单元格占用矩阵"""
@@ -135,7 +191,7 @@ class HtmlChunker:
                 occupied[row_idx] = {}
 
             col_idx = 0
-            cells = row.find_all(["td", "th"])
+            cells = row.iter("td", "th")
 
             for cell in cells:
                 while col_idx in occupied[row_idx]:
@@ -157,14 +213,12 @@ class HtmlChunker:
 
         return occupied
 
-    def _rebuild_rows(self, rows: RowList, occupied: dict, soup: BeautifulSoup) -> RowList:
+    def _rebuild_rows(self, rows: RowList, occupied: dict) -> RowList:
         """根据占用矩阵重建行"""
         normalized_rows = []
 
         for row_idx, row in enumerate(rows):
-            new_row = soup.new_tag("tr")
-            for attr, value in row.attrs.items():
-                new_row[attr] = value
+            new_row = _new_element("tr", row.attrib)
 
             if row_idx not in occupied:
                 normalized_rows.append(new_row)
@@ -173,71 +227,88 @@ class HtmlChunker:
             max_col = max(occupied[row_idx].keys()) if occupied[row_idx] else -1
 
             for col_idx in range(max_col + 1):
-                cell = self._create_normalized_cell(occupied, row_idx, col_idx, soup)
+                cell = self._create_normalized_cell(occupied, row_idx, col_idx)
                 new_row.append(cell)
 
             normalized_rows.append(new_row)
 
         return normalized_rows
 
-    def _create_normalized_cell(
-        self, occupied: dict, row_idx: int, col_idx: int, soup: BeautifulSoup
-    ):
+    def _create_normalized_cell(self, occupied: dict, row_idx: int, col_idx: int):
         """创建规范化的单元格"""
         if col_idx not in occupied[row_idx]:
-            return soup.new_tag("td")
+            return etree.Element("td")
 
         orig_cell, is_origin, _, _ = occupied[row_idx][col_idx]
-
-        if is_origin:
-            new_cell = copy.copy(orig_cell)
-            if "rowspan" in new_cell.attrs:
-                del new_cell["rowspan"]
-            if "colspan" in new_cell.attrs:
-                del new_cell["colspan"]
-            return new_cell
-
-        # 填充单元格
-        fill_cell = soup.new_tag(orig_cell.name)
-        for child in orig_cell.children:
-            fill_cell.append(copy.copy(child))
-        for attr, value in orig_cell.attrs.items():
-            if attr not in ("rowspan", "colspan"):
-                fill_cell[attr] = value
-
-        existing_class = fill_cell.get("class", [])
-        if isinstance(existing_class, str):
-            existing_class = existing_class.split()
-        fill_cell["class"] = existing_class + ["span-fill"]
-
-        return fill_cell
-
-    def _calculate_base_overhead(self, context_div, caption, header_rows: RowList) -> int:
+        attrs = {
+            attr: value for attr, value in orig_cell.attrib.items()
+            if attr not in ("rowspan", "colspan")
+        }
+
+        # 起始单元格去掉跨度属性，其余位置生成带 span-fill 标记的填充单元格
+        if not is_origin:
+            attrs["class"] = " ".join([*attrs.get("class", "").split(), "span-fill"])
+        new_cell = _new_element(orig_cell.tag, attrs)
+        new_cell.text = orig_cell.text
+        new_cell.extend(copy.deepcopy(child) for child in orig_cell)
+        return new_cell
+
+    def _calculate_base_overhead(
+        self, context: _ContextTemplate | None, caption_html: str, header_strs: list[str]
+    ) -> int:
         """计算基础固定开销"""
-        fixed_parts = []
-        if context_div:
-            fixed_parts.append(str(context_div))
-        if caption:
-            fixed_parts.append(str(caption))
-        for h_row in header_rows:
-            fixed_parts.append(str(h_row))
-        return self._estimate_tokens("".join(fixed_parts))
-
-    def _single_chunk_result(self, html_content: str) -> ChunkResult:
+        context_html = context.html if context else ""
+        return estimate_tokens(f"{context_html}{caption_html}{''.join(header_strs)}")
+
+    def _single_chunk_result(self, html_content: str | bytes) -> ChunkResult:
         """返回单个 chunk 的结果"""
+        if isinstance(html_content, bytes):
+            html_content = html_content.decode("utf-8")
         stats = ChunkStats(total_chunks=1, oversized_chunks=0)
         return ChunkResult(chunks=[html_content], warnings=[], stats=stats)
 
+    def _serialize_context(self, context_div) -> _ContextTemplate:
+        """序列化上下文 div，拆出开闭标签以便直接拼接注释文本"""
+        shell = _new_element(context_div.tag, context_div.attrib)
+        close_tag = f"</{shell.tag}>"
+        return _ContextTemplate(
+            html=_to_html(context_div),
+            open_tag=_to_html(shell).removesuffix(close_tag),
+            text=html.escape(_TEXT_CONTENT(context_div), quote=False),
+            close_tag=close_tag,
+        )
+
+    def _serialize_table_head(
+        self, original_table, caption_html: str, header_strs: list[str]
+    ) -> str:
+        """拼接每个 chunk 共用的表格开头（table 标签、标题、表头、tbody 开标签）"""
+        table_tag = _new_element(
+            "table",
+            {**original_table.attrib, "border": "1", "style": "border-collapse:collapse"},
+        )
+        table_open = _to_html(table_tag).removesuffix("</table>")
+        thead_html = "".join(header_strs)
+        return f"{table_open}{caption_html}<thead>{thead_html}</thead><tbody>"
+
+    def _measure_rows(
+        self, data_rows: RowList, with_refs: bool
+    ) -> tuple[list[str], list[int], list[set[str]]]:
+        """每行只序列化一次，预先算好 token 数和注释引用"""
+        row_strs = [_to_html(row) for row in data_rows]
+        row_tokens = estimate_tokens_batch(row_strs)
+        if not with_refs:
+            return row_strs, row_tokens, [set() for _ in row_strs]
+        row_refs = [self._extract_note_references(row_str) for row_str in row_strs]
+        return row_strs, row_tokens, row_refs
+
     def _split_rows(
         self,
         data_rows: RowList,
-        context_div,
-        caption,
-        header_rows: RowList,
-        original_table,
+        context: _ContextTemplate | None,
+        table_head: str,
         header_notes: NotesDict,
         conditional_notes: NotesDict,
-        header_text: str,
+        header_refs: set[str],
         base_overhead: int,
     ) -> tuple[list[str], list[ChunkWarning], list[int]]:
         """执行行切分"""
@@ -245,209 +316,171 @@ class HtmlChunker:
         warnings: list[ChunkWarning] = []
         token_counts: list[int] = []
 
-        current_chunk_data: RowList = []
-        current_chunk_tokens = 0
+        all_row_strs, all_row_tokens, all_row_refs = self._measure_rows(
+            data_rows, bool(header_notes or conditional_notes)
+        )
+        if all_row_strs:
+            # 小表整体放得下时直接生成单个 chunk，跳过逐行切分判断
+            all_refs = header_refs.union(*all_row_refs)
+            total_tokens = (
+                sum(all_row_tokens)
+                + base_overhead
+                + self._calculate_notes_overhead(all_refs, header_notes, conditional_notes)
+            )
+            if self._fits_single_chunk(len(all_row_strs), total_tokens):
+                chunk = self._build_chunk(
+                    all_row_strs, all_refs, context, table_head, header_notes, conditional_notes
+                )
+                return [chunk], [], [total_tokens]
 
-        for i, row in enumerate(data_rows):
-            row_tokens = self._estimate_tokens(str(row))
+        current_chunk_data: list[str] = []
+        # 当前 chunk 的注释引用（含表头）与注释开销，只在命中新的条件注释时重算开销
+        chunk_refs = set(header_refs)
+        header_overhead = self._calculate_notes_overhead(
+            chunk_refs, header_notes, conditional_notes
+        )
+        notes_overhead = header_overhead
+        current_chunk_tokens = 0
 
-            if current_chunk_data and self._should_split(
-                current_chunk_data,
-                row_tokens,
-                row,
-                header_notes,
-                conditional_notes,
-                header_text,
-                base_overhead,
-                current_chunk_tokens,
-            ):
-                # 输出当前 chunk
-                final_total = self._calculate_chunk_total(
+        def emit_chunk(total_tokens: int) -> None:
+            token_counts.append(total_tokens)
+            chunks.append(
+                self._build_chunk(
                     current_chunk_data,
+                    chunk_refs,
+                    context,
+                    table_head,
                     header_notes,
                     conditional_notes,
-                    header_text,
-                    base_overhead,
-                    current_chunk_tokens,
                 )
-                token_counts.append(final_total)
-                chunks.append(
-                    self._build_chunk(
-                        current_chunk_data,
-                        context_div,
-                        caption,
-                        header_rows,
-                        original_table,
-                        header_notes,
-                        conditional_notes,
-                        header_text,
-                    )
+            )
+
+        for row_str, row_tokens, row_refs in zip(
+            all_row_strs, all_row_tokens, all_row_refs, strict=True
+        ):
+            row_overhead = self._grow_notes_overhead(
+                chunk_refs, row_refs, notes_overhead, header_notes, conditional_notes
+            )
+            current_total = current_chunk_tokens + base_overhead + notes_overhead
+            potential_total = current_chunk_tokens + row_tokens + base_overhead + row_overhead
+            if current_chunk_data and self._should_split(
+                len(current_chunk_data), current_total, potential_total
+            ):
+                emit_chunk(current_total)
+                current_chunk_data, chunk_refs, current_chunk_tokens = [], set(header_refs), 0
+                row_overhead = self._grow_notes_overhead(
+                    chunk_refs, row_refs, header_overhead, header_notes, conditional_notes
                 )
-                current_chunk_data = []
-                current_chunk_tokens = 0
 
-            current_chunk_data.append(row)
+            current_chunk_data.append(row_str)
+            chunk_refs |= row_refs
+            notes_overhead = row_overhead
             current_chunk_tokens += row_tokens
 
             # 检查超限
             warning = self._check_overflow(
-                current_chunk_data,
-                header_notes,
-                conditional_notes,
-                header_text,
-                base_overhead,
-                current_chunk_tokens,
+                len(current_chunk_data),
+                current_chunk_tokens + base_overhead + notes_overhead,
                 len(chunks),
             )
             if warning:
                 warnings.append(warning)
-                token_counts.append(warning.actual_tokens)
-                chunks.append(
-                    self._build_chunk(
-                        current_chunk_data,
-                        context_div,
-                        caption,
-                        header_rows,
-                        original_table,
-                        header_notes,
-                        conditional_notes,
-                        header_text,
-                    )
-                )
-                current_chunk_data = []
-                current_chunk_tokens = 0
+                emit_chunk(warning.actual_tokens)
+                current_chunk_data, chunk_refs, current_chunk_tokens = [], set(header_refs), 0
+                notes_overhead = header_overhead
 
-            # 最后一行
-            if i == len(data_rows) - 1 and current_chunk_data:
-                final_total = self._calculate_chunk_total(
-                    current_chunk_data,
-                    header_notes,
-                    conditional_notes,
-                    header_text,
-                    base_overhead,
-                    current_chunk_tokens,
-                )
-                token_counts.append(final_total)
-                chunks.append(
-                    self._build_chunk(
-                        current_chunk_data,
-                        context_div,
-                        caption,
-                        header_rows,
-                        original_table,
-                        header_notes,
-                        conditional_notes,
-                        header_text,
-                    )
-                )
+        # 最后一个 chunk
+        if current_chunk_data:
+            emit_chunk(current_chunk_tokens + base_overhead + notes_overhead)
 
         return chunks, warnings, token_counts
 
-    def _should_split(
-        self,
-        pending_rows: RowList,
-        row_tokens: int,
-        new_row,
-        header_notes: NotesDict,
-        conditional_notes: NotesDict,
-        header_text: str,
-        base_overhead: int,
-        current_tokens: int,
-    ) -> bool:
-        """判断是否应该切分"""
+    def _fits_single_chunk(self, row_count: int, total_tokens: int) -> bool:
+        """整张表是否不会被切分（与 _should_split 的判断一致）"""
         if self.config.max_tokens is not None:
-            current_total = self._calculate_chunk_total(
-                pending_rows,
-                header_notes,
-                conditional_notes,
-                header_text,
-                base_overhead,
-                current_tokens,
-            )
-
-            test_rows = pending_rows + [new_row]
-            notes_overhead = self._calculate_notes_overhead(
-                test_rows, header_notes, conditional_notes, header_text
+            return (
+                total_tokens <= self.config.max_tokens
+                and not self._prefer_min_reached(total_tokens)
             )
-            potential_total = current_tokens + row_tokens + base_overhead + notes_overhead
 
-            if potential_total > self.config.max_tokens:
-                return True
+        return not self._exceeds_max_rows(row_count)
 
+    def _should_split(self, pending_count: int, current_total: int, potential_total: int) -> bool:
+        """判断是否应该切分（current_total / potential_total 为加入新行前后的 chunk 总 token 数）"""
+        if self.config.max_tokens is not None:
             return (
-                self.config.min_tokens is not None
-                and self.config.token_strategy.value == "prefer_min"
-                and current_total >= self.config.min_tokens
+                potential_total > self.config.max_tokens
+                or self._prefer_min_reached(current_total)
             )
 
-        return len(pending_rows) >= (self.config.max_rows or 8)
+        return self._exceeds_max_rows(pending_count + 1)
 
-    def _calculate_chunk_total(
+    def _prefer_min_reached(self, current_total: int) -> bool:
+        """prefer_min 策略下 chunk 已达到最小 token 数，应尽早切分"""
+        return (
+            self.config.min_tokens is not None
+            and self.config.token_strategy == TokenStrategy.PREFER_MIN
+            and current_total >= self.config.min_tokens
+        )
+
+    def _exceeds_max_rows(self, row_count: int) -> bool:
+        """按行数切分时 row_count 行是否超出单个 chunk 的最大行数"""
+        return row_count > (self.config.max_rows or 8)
+
+    def _grow_notes_overhead(
         self,
-        rows: RowList,
+        chunk_refs: set[str],
+        new_refs: set[str],
+        notes_overhead: int,
         header_notes: NotesDict,
         conditional_notes: NotesDict,
-        header_text: str,
-        base_overhead: int,
-        current_tokens: int,
     ) -> int:
-        """计算 chunk 总 token 数"""
-        notes_overhead = self._calculate_notes_overhead(
-            rows, header_notes, conditional_notes, header_text
+        """加入新引用后的注释开销（未命中新的条件注释时沿用当前开销）"""
+        if new_refs <= chunk_refs or conditional_notes.keys().isdisjoint(new_refs - chunk_refs):
+            return notes_overhead
+        return self._calculate_notes_overhead(
+            chunk_refs | new_refs, header_notes, conditional_notes
         )
-        return current_tokens + base_overhead + notes_overhead
 
     def _calculate_notes_overhead(
         self,
-        rows: RowList,
+        chunk_refs: set[str],
         header_notes: NotesDict,
         conditional_notes: NotesDict,
-        header_text: str,
     ) -> int:
-        """计算注释开销"""
+        """计算注释开销（chunk_refs 已包含表头引用，同一组命中注释只计算一次）"""
         if not header_notes and not conditional_notes:
             return 0
 
-        chunk_text = " ".join(str(row) for row in rows)
-        all_text = chunk_text + " " + header_text
-        chunk_refs = self._extract_note_references(all_text)
-
-        actual_notes = []
-        seen_notes: set[str] = set()
-
-        for note in header_notes.values():
-            if note not in seen_notes:
-                actual_notes.append(note)
-                seen_notes.add(note)
-
-        for key, note in conditional_notes.items():
-            if key in chunk_refs and note not in seen_notes:
-                actual_notes.append(note)
-                seen_notes.add(note)
-
-        if not actual_notes:
-            return 0
+        active_keys = frozenset(chunk_refs.intersection(conditional_notes))
+        overhead = self._notes_overhead_cache.get(active_keys)
+        if overhead is not None:
+            return overhead
 
-        notes_text = " | ".join(actual_notes)
-        return self._estimate_tokens(f" 【表格注释】{notes_text}")
+        actual_notes = self._collect_matched_notes(header_notes, conditional_notes, chunk_refs)
+        overhead = 0
+        if actual_notes:
+            notes_text = " | ".join(actual_notes)
+            overhead = estimate_tokens(f" 【表格注释】{notes_text}")
+        self._notes_overhead_cache[active_keys] = overhead
+        return overhead
 
     def _extract_note_references(self, text: str) -> set[str]:
         """从文本中提取注释引用"""
         refs: set[str] = set()
 
-        multi_refs = re.findall(r"\[(注)([\d、,，]+)\]", text)
-        for prefix, nums_str in multi_refs:
-            nums = re.split(r"[、,，]", nums_str)
-            for num in nums:
-                num = num.strip()
-                if num:
-                    refs.add(f"{prefix}{num}")
+        # 所有文字引用都含"注"或"说明"，绝大多数行可直接跳过正则扫描
+        if "注" in text or "说明" in text:
+            for prefix, nums_str in _REF_MULTI_RE.findall(text):
+                for num in _REF_NUM_SEP_RE.split(nums_str):
+                    num = num.strip()
+                    if num:
+                        refs.add(f"{prefix}{num}")
 
-        bracket_refs = re.findall(r"\[(注\s*\d*|备注\s*\d*|说明\s*\d*|注意\s*\d*)\s*\]", text)
-        refs.update(ref.replace(" ", "") for ref in bracket_refs)
+            bracket_refs = _REF_BRACKET_RE.findall(text)
+            refs.update(ref.replace(" ", "") for ref in bracket_refs)
 
-        superscript_refs = re.findall(r"[^\[](注\d+)(?:[：:）\)]|$|\s)", text)
-        refs.update(superscript_refs)
+            refs.update(_REF_SUPERSCRIPT_RE.findall(text))
 
         if "*" in text:
             refs.add("*")
@@ -457,27 +490,16 @@ class HtmlChunker:
         return refs
 
     def _check_overflow(
-        self,
-        rows: RowList,
-        header_notes: NotesDict,
-        conditional_notes: NotesDict,
-        header_text: str,
-        base_overhead: int,
-        current_tokens: int,
-        chunk_index: int,
+        self, row_count: int, current_total: int, chunk_index: int
     ) -> ChunkWarning | None:
         """检查是否超限"""
         if self.config.max_tokens is None:
             return None
 
-        current_total = self._calculate_chunk_total(
-            rows, header_notes, conditional_notes, header_text, base_overhead, current_tokens
-        )
-
         if current_total > self.config.max_tokens:
             reason = (
                 "单行数据 + 固定开销 + 注释超过 token 限制"
-                if len(rows) == 1
+                if row_count == 1
                 else "累积数据超过 token 限制"
             )
             return ChunkWarning(
@@ -485,7 +507,7 @@ class HtmlChunker:
                 actual_tokens=current_total,
                 limit=self.config.max_tokens,
                 overflow=current_total - self.config.max_tokens,
-                row_count=len(rows),
+                row_count=row_count,
                 reason=reason,
             )
 
@@ -493,55 +515,25 @@ class HtmlChunker:
 
     def _build_chunk(
         self,
-        data_rows: RowList,
-        context_div,
-        caption,
-        header_rows: RowList,
-        original_table,
+        row_strs: list[str],
+        chunk_refs: set[str],
+        context: _ContextTemplate | None,
+        table_head: str,
         header_notes: NotesDict,
         conditional_notes: NotesDict,
-        header_text: str,
     ) -> str:
-        """组装一个 chunk"""
-        new_soup = BeautifulSoup("<div></div>", "html.parser")
-        wrapper_div = new_soup.div
-
-        # 提取注释引用
-        chunk_text = " ".join(str(row) for row in data_rows)
-        all_text = chunk_text + " " + header_text
-        chunk_refs = self._extract_note_references(all_text)
-
-        matched_notes = self._collect_matched_notes(header_notes, conditional_notes, chunk_refs)
-
-        # 添加上下文
-        if context_div:
-            new_context = copy.copy(context_div)
-            if matched_notes:
-                notes_text = " | ".join(matched_notes)
-                new_context.string = (new_context.get_text() or "") + f" 【表格注释】{notes_text}"
-            wrapper_div.append(new_context)
-
-        # 构建表格
-        new_table = new_soup.new_tag("table")
-        new_table.attrs = original_table.attrs
-        new_table["border"] = "1"
-        new_table["style"] = "border-collapse:collapse"
-
-        if caption:
-            new_table.append(copy.copy(caption))
-
-        new_thead = new_soup.new_tag("thead")
-        for h_row in header_rows:
-            new_thead.append(copy.copy(h_row))
-        new_table.append(new_thead)
-
-        new_tbody = new_soup.new_tag("tbody")
-        for d_row in data_rows:
-            new_tbody.append(copy.copy(d_row))
-        new_table.append(new_tbody)
-
-        wrapper_div.append(new_table)
-        return str(wrapper_div)
+        """组装一个 chunk（直接拼接已序列化的字符串，不复制节点）"""
+        context_html = ""
+        if context:
+            matched_notes = (
+                self._collect_matched_notes(header_notes, conditional_notes, chunk_refs)
+                if header_notes or conditional_notes
+                else []
+            )
+            context_html = context.render(matched_notes)
+
+        rows_html = "".join(row_strs)
+        return f"<div>{context_html}{table_head}{rows_html}</tbody></table></div>"
 
     def _collect_matched_notes(
         self,
@@ -549,21 +541,14 @@ class HtmlChunker:
         conditional_notes: NotesDict,
         chunk_refs: set[str],
     ) -> list[str]:
-        """收集匹配的注释"""
-        matched_notes: list[str] = []
-        seen_notes: set[str] = set()
-
-        for note in header_notes.values():
-            if note not in seen_notes:
-                matched_notes.append(note)
-                seen_notes.add(note)
+        """收集匹配的注释（dict 按插入顺序去重）"""
+        matched_notes = dict.fromkeys(header_notes.values())
 
         for key, note in conditional_notes.items():
-            if key in chunk_refs and note not in seen_notes:
-                matched_notes.append(note)
-                seen_notes.add(note)
+            if key in chunk_refs:
+                matched_notes[note] = None
 
-        return matched_notes
+        return list(matched_notes)
 
     def _build_stats(
         self,
@@ -646,9 +631,3 @@ def distribute_assets_and_chunk(
             ),
         },
     }
-
-
-def estimate_tokens(text: str) -> int:
-    """估算 token 数量（兼容旧接口）"""
-    tokenizer = tiktoken.get_encoding("cl100k_base")
-    return len(tokenizer.encode(text))
@@ -10,20 +10,29 @@ Excel 转 HTML 转换器 - RAG 增强版
 5. 注释提取和分发
 """
 
+import html
 import json
-import re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 
 from loguru import logger
+from openpyxl.worksheet.cell_range import CellRange
 
 from ..base_converter import BaseExcelConverter
+from ..models import MergedCellInfo
+
+# 需要 HTML 转义的字符
+_UNSAFE_CHARS = frozenset("<>&\"'")
 
 
 @dataclass
 class ExcelToHtmlConverter(BaseExcelConverter):
     """Excel 转 HTML 转换器"""
 
+    _span_attrs: dict[tuple[int, int], str] = field(default_factory=dict, init=False, repr=False)
+    # 被合并区域覆盖到的行号，其余行的单元格无需查合并信息
+    _merged_rows: set[int] = field(default_factory=set, init=False, repr=False)
+
     def _get_file_extension(self) -> str:
         """返回输出文件扩展名"""
         return ".html"
@@ -44,178 +53,140 @@ class ExcelToHtmlConverter(BaseExcelConverter):
         flattened_headers: dict[int, str],
         header_rows: int,
         data_end_row: int,
+        footer_notes: list[str],
     ) -> str:
         """将单个 sheet 转换为 RAG 增强的 HTML 表格"""
-        footer_notes, _ = self._detect_footer_notes(sheet, header_rows)
-        notes_dict = self._parse_notes_with_keys(footer_notes)
-        header_text = " ".join(flattened_headers.values())
-        header_note_refs = self._extract_note_references(header_text)
+        # 表头按列号顺序构建，取一次值列表供注释匹配和 thead 共用
+        header_values = list(flattened_headers.values())
+        header_notes, conditional_notes = self._classify_notes(
+            footer_notes, " ".join(header_values)
+        )
         html_parts = self._build_html_parts(
-            sheet, filename, flattened_headers, notes_dict,
-            header_note_refs, header_rows, data_end_row,
+            sheet, filename, header_values, header_notes,
+            conditional_notes, header_rows, data_end_row,
         )
         return "\n".join(html_parts)
 
-    def _join_sheets(self, sheet_contents: list[str]) -> str:
-        """合并多个 sheet 的内容"""
-        return "\n".join(sheet_contents)
-
-
-    def _parse_notes_with_keys(self, notes_list: list[str]) -> dict[str, str]:
-        """解析注释列表，提取注释编号和内容"""
-        notes_dict: dict[str, str] = {}
-        for note in notes_list:
-            note = note.strip()
-            if not note:
-                continue
-            split_pattern = r"(?=\[注[\d、,，]+\]|\[备注\d*\]|\[说明\d*\])"
-            parts = re.split(split_pattern, note)
-            parts = [p.strip() for p in parts if p.strip()]
-            if len(parts) > 1:
-                for part in parts:
-                    self._parse_single_note(part, notes_dict)
-            else:
-                self._parse_single_note(note, notes_dict)
-        return notes_dict
-
-    def _parse_single_note(self, note: str, notes_dict: dict[str, str]) -> None:
-        """解析单个注释"""
-        note = note.strip()
-        if not note:
-            return
-        multi_num_match = re.match(r"^\[(注)([\d、,，]+)\]", note)
-        if multi_num_match:
-            prefix = multi_num_match.group(1)
-            nums_str = multi_num_match.group(2)
-            nums = re.split(r"[、,，]", nums_str)
-            for num in nums:
-                num = num.strip()
-                if num:
-                    notes_dict[f"{prefix}{num}"] = note
-            return
-        bracket_match = re.match(r"^\[([注备说][注明意]?\d*)\]", note)
-        if bracket_match:
-            notes_dict[bracket_match.group(1)] = note
-            return
-        paren_match = re.match(r"^[（\(]([注备说][注明意]?\d*)[）\)]", note)
-        if paren_match:
-            notes_dict[paren_match.group(1)] = note
-            return
-        plain_match = re.match(r"^(注\d*|备注\d*|说明\d*|注意\d*)[：:．.、]?\s*", note)
-        if plain_match:
-            key_match = re.match(r"^(注\d*|备注\d*|说明\d*|注意\d*)", note)
-            if key_match:
-                notes_dict[key_match.group(1)] = note
-            return
-        if note[0] in "*※●◆△▲":
-            notes_dict[note[0]] = note
-            return
-        notes_dict[note[:10]] = note
-
-    def _extract_note_references(self, text: str) -> set[str]:
-        """从文本中提取注释引用"""
-        refs: set[str] = set()
-        multi_refs = re.findall(r"\[(注)([\d、,，]+)\]", text)
-        for prefix, nums_str in multi_refs:
-            nums = re.split(r"[、,，]", nums_str)
-            for num in nums:
-                num = num.strip()
-                if num:
-                    refs.add(f"{prefix}{num}")
-        bracket_refs = re.findall(r"\[(注\d*|备注\d*|说明\d*|注意\d*)\]", text)
-        refs.update(bracket_refs)
-        superscript_refs = re.findall(r"[^\[](注\d+)(?:[：:）\)]|$|\s)", text)
-        refs.update(superscript_refs)
-        if "*" in text:
-            refs.add("*")
-        if "※" in text:
-            refs.add("※")
-        return refs
+    def _get_sheet_separator(self) -> str:
+        """返回 sheet 之间的分隔文本"""
+        return "\n"
+
+    def _extract_merged_cells(self, merged_ranges: list[CellRange]) -> None:
+        """获取合并单元格信息，并为每个合并区域预生成 span 属性，按行记录合并区域"""
+        super()._extract_merged_cells(merged_ranges)
+        self._span_attrs = {
+            key: self._format_span_attrs(info) for key, info in self._merged_origins.items()
+        }
+        self._merged_rows = {
+            row_idx
+            for merged_range in merged_ranges
+            for row_idx in range(merged_range.min_row, merged_range.max_row + 1)
+        }
+
+    def _format_span_attrs(self, info: MergedCellInfo) -> str:
+        """生成 rowspan/colspan 属性字符串"""
+        span_attrs = []
+        if info.rowspan > 1:
+            span_attrs.append(f'rowspan="{info.rowspan}"')
+        if info.colspan > 1:
+            span_attrs.append(f'colspan="{info.colspan}"')
+        return " " + " ".join(span_attrs) if span_attrs else ""
 
 
     def _build_html_parts(
-        self, sheet, filename: str, flattened_headers: dict[int, str],
-        notes_dict: dict[str, str], header_note_refs: set[str],
+        self, sheet, filename: str, header_values: list[str],
+        header_notes: dict[str, str], conditional_notes: dict[str, str],
         header_rows: int, data_end_row: int,
     ) -> list[str]:
         """构建 HTML 各部分"""
         html_parts: list[str] = []
+        safe_filename = self._html_safe(filename)
         context_html = (
-            f'<div class="rag-context">【文档上下文】来源：{filename} | 数据类型：表格数据</div>'
+            f'<div class="rag-context">【文档上下文】来源：{safe_filename} | 数据类型：表格数据</div>'
         )
         html_parts.append(context_html)
-        if notes_dict:
-            html_parts.append(self._build_notes_meta(notes_dict, header_note_refs))
+        if header_notes or conditional_notes:
+            html_parts.append(self._build_notes_meta(header_notes, conditional_notes))
         html_parts.append(
             f'<table border="1" style="border-collapse:collapse" '
-            f'data-source="{filename}" data-sheet="{sheet.title}">'
+            f'data-source="{safe_filename}" data-sheet="{self._html_safe(sheet.title)}">'
         )
         if self.keywords:
-            keyword_str = "，".join(self.keywords)
+            keyword_str = self._html_safe("，".join(self.keywords))
             html_parts.append(f"    <caption>关键检索词：{keyword_str}</caption>")
-        html_parts.extend(self._build_thead(flattened_headers))
-        html_parts.extend(self._build_tbody(sheet, header_rows, data_end_row))
+        html_parts.extend(self._build_thead(header_values))
+        html_parts.extend(self._build_tbody(header_rows, data_end_row))
         html_parts.append("</table>")
         return html_parts
 
-    def _build_notes_meta(self, notes_dict: dict[str, str], header_note_refs: set[str]) -> str:
+    def _build_notes_meta(
+        self, header_notes: dict[str, str], conditional_notes: dict[str, str]
+    ) -> str:
         """构建注释元数据"""
-        header_notes = {k: v for k, v in notes_dict.items() if k in header_note_refs}
-        other_notes = {k: v for k, v in notes_dict.items() if k not in header_note_refs}
-        notes_meta = {"header_notes": header_notes, "conditional_notes": other_notes}
-        notes_json = json.dumps(notes_meta, ensure_ascii=False)
+        notes_meta = {"header_notes": header_notes, "conditional_notes": conditional_notes}
+        # 注释内容中的 "</" 会提前结束 script 标签，转成等价的 JSON 转义
+        notes_json = json.dumps(notes_meta, ensure_ascii=False).replace("</", "<\\/")
         return f'<script type="application/json" class="table-notes-meta">{notes_json}</script>'
 
-    def _build_thead(self, flattened_headers: dict[int, str]) -> list[str]:
-        """构建表头"""
-        parts = ["    <thead>", "        <tr>"]
-        for col_idx in sorted(flattened_headers.keys()):
-            flat_header = flattened_headers.get(col_idx, "")
-            parts.append(f"            <th>{flat_header}</th>")
-        parts.extend(["        </tr>", "    </thead>"])
-        return parts
+    def _build_thead(self, header_values: list[str]) -> list[str]:
+        """构建表头（整行一次拼接）"""
+        header_cells = "".join(
+            f"            <th>{self._html_safe(value)}</th>\n" for value in header_values
+        )
+        return ["    <thead>", f"        <tr>\n{header_cells}        </tr>", "    </thead>"]
 
-    def _build_tbody(self, sheet, header_rows: int, data_end_row: int) -> list[str]:
-        """构建表体"""
+    def _build_tbody(self, header_rows: int, data_end_row: int) -> list[str]:
+        """构建表体（每行只追加一个字符串）"""
         parts = ["    <tbody>"]
-        for row_idx in range(header_rows + 1, sheet.max_row + 1):
-            is_note_row = row_idx > data_end_row
-            row_class = ' class="table-note-row"' if is_note_row else ""
-            parts.append(f"        <tr{row_class}>")
-            for col_idx in range(1, sheet.max_column + 1):
-                cell_html = self._build_cell(sheet, row_idx, col_idx)
-                if cell_html:
-                    parts.append(cell_html)
-            parts.append("        </tr>")
+        # 方法查找提到循环外；join 列表比 join 生成器少一层帧切换
+        build_merged_cell, build_plain_cell = self._build_cell, self._build_plain_cell
+        merged_rows = self._merged_rows
+        for row_idx, row in enumerate(self._rows[header_rows:], start=header_rows + 1):
+            row_class = ' class="table-note-row"' if row_idx > data_end_row else ""
+            # 不与任何合并区域相交的行不需要逐格查合并信息
+            build_cell = build_merged_cell if row_idx in merged_rows else build_plain_cell
+            row_cells = "".join(
+                [build_cell(row_idx, col_idx, cell) for col_idx, cell in enumerate(row, start=1)]
+            )
+            parts.append(f"        <tr{row_class}>\n{row_cells}        </tr>")
         parts.append("    </tbody>")
         return parts
 
-    def _build_cell(self, sheet, row_idx: int, col_idx: int) -> str | None:
-        """构建单元格"""
-        info = self._merged_info.get((row_idx, col_idx))
-        if info and info.skip:
-            return None
+    def _build_cell(self, row_idx: int, col_idx: int, cell) -> str:
+        """构建单元格（带换行），被合并覆盖的单元格返回空串"""
+        key = (row_idx, col_idx)
+        if key in self._merged_covered:
+            return ""
+        info = self._merged_origins.get(key)
         if info:
-            span_attrs = []
-            if info.rowspan > 1:
-                span_attrs.append(f'rowspan="{info.rowspan}"')
-            if info.colspan > 1:
-                span_attrs.append(f'colspan="{info.colspan}"')
-            span_str = " " + " ".join(span_attrs) if span_attrs else ""
+            span_str = self._span_attrs[key]
             cell_content = info.value if info.value is not None else ""
         else:
-            cell = sheet.cell(row=row_idx, column=col_idx)
             cell_content = self._format_cell_value(cell)
             span_str = ""
-        return f"            <td{span_str}>{cell_content}</td>"
+        return f"            <td{span_str}>{self._html_safe(cell_content)}</td>\n"
+
+    def _build_plain_cell(self, _row_idx: int, _col_idx: int, cell) -> str:
+        """构建单元格（所在行不与任何合并区域相交时使用，行列号仅为与 _build_cell 签名一致）"""
+        return f"            <td>{self._html_safe(self._format_cell_value(cell))}</td>\n"
+
+    def _html_safe(self, text: str) -> str:
+        """HTML 转义（绝大多数单元格不含特殊字符，直接返回）"""
+        if _UNSAFE_CHARS.isdisjoint(text):
+            return text
+        return html.escape(text, quote=True)
 
 
 def convert_excel_to_html(
     excel_path: str,
     keywords: list[str] | None = None,
     output_path: str | None = None,
+    keep_formulas: bool = False,
 ) -> str | None:
-    """将单个 Excel 文件转换为 RAG 增强的 HTML（兼容旧接口）"""
-    converter = ExcelToHtmlConverter(keywords=keywords)
+    """将单个 Excel 文件转换为 RAG 增强的 HTML（兼容旧接口）
+
+    默认输出公式的缓存计算值；keep_formulas=True 时输出公式原文，加载更慢。
+    """
+    converter = ExcelToHtmlConverter(keywords=keywords, keep_formulas=keep_formulas)
     result = converter.convert(Path(excel_path), Path(output_path) if output_path else None)
     return str(result) if result else None
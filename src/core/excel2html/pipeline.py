@@ -4,147 +4,40 @@ Excel 转 HTML 完整流水线
 """
 
 import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
 
 from loguru import logger
 
-from ..models import ChunkConfig, ConversionResult, SplitMode
-from .chunker import HtmlChunker
-from .converter import ExcelToHtmlConverter
+from ..models import ConversionResult, OutputFormat
+from ..unified_pipeline import UnifiedPipeline
 
 
 @dataclass
 class ConversionPipeline:
-    """Excel 转 HTML 转换流水线"""
+    """Excel 转 HTML 转换流水线（HTML 格式的 UnifiedPipeline）"""
 
     keywords: list[str] | None = None
     max_rows_per_chunk: int | None = None
     target_tokens: int = 1024
     separator: str = "!!!_CHUNK_BREAK_!!!"
+    keep_formulas: bool = False
 
     def run(self, excel_path: Path) -> ConversionResult | None:
         """执行完整的转换流水线"""
-        source_path = Path(excel_path) if not isinstance(excel_path, Path) else excel_path
-
-        if not source_path.exists():
-            logger.error(f"找不到文件 '{source_path}'")
-            return None
-
-        self._log_start(source_path)
-
-        # 第一步：Excel -> HTML
-        html_path = self._convert_to_html(source_path)
-        if not html_path:
-            return None
-
-        # 第二步：HTML -> Chunks
-        chunk_result = self._chunk_html(html_path, source_path)
-        if not chunk_result:
-            return None
-
-        return chunk_result
-
-    def _log_start(self, source_path: Path) -> None:
-        """记录开始日志"""
-        logger.info("=" * 50)
-        logger.info(f"🚀 开始处理流水线: {source_path.name}")
-        logger.info("=" * 50)
-
-    def _convert_to_html(self, source_path: Path) -> Path | None:
-        """执行 Excel 到 HTML 转换"""
-        logger.info("📌 第一步：Excel 转 HTML（增强版）")
-
-        converter = ExcelToHtmlConverter(keywords=self.keywords)
-        html_path = converter.convert(source_path)
-
-        if not html_path:
-            logger.error("流水线中断：HTML 转换失败")
-            return None
-
-        return html_path
-
-    def _chunk_html(self, html_path: Path, source_path: Path) -> ConversionResult | None:
-        """执行 HTML 切分"""
-        logger.info("📌 第二步：HTML 切分为 Chunks")
-
-        html_content = html_path.read_text(encoding="utf-8")
-
-        config = self._build_chunk_config()
-        chunker = HtmlChunker(config=config)
-        result = chunker.chunk(html_content)
-
-        self._log_chunk_result(result)
-
-        # 保存结果
-        chunk_path = source_path.parent / f"{source_path.stem}.html"
-        return self._save_chunks(chunk_path, result, html_path)
-
-    def _build_chunk_config(self) -> ChunkConfig:
-        """构建切分配置"""
-        if self.max_rows_per_chunk is None:
-            logger.info(f"📊 使用 token 模式，目标每 chunk ≤ {self.target_tokens} tokens")
-            return ChunkConfig(
-                split_mode=SplitMode.BY_TOKENS,
-                max_tokens=self.target_tokens,
-                separator=self.separator,
-            )
-        else:
-            logger.info(f"📊 使用行数模式，每 chunk {self.max_rows_per_chunk} 行")
-            return ChunkConfig(
-                split_mode=SplitMode.BY_ROWS,
-                max_rows=self.max_rows_per_chunk,
-                separator=self.separator,
-            )
-
-    def _log_chunk_result(self, result) -> None:
-        """记录切分结果"""
-        stats = result.stats
-        logger.info(f"🔪 切分完成：共生成 {stats.total_chunks} 个片段")
-        logger.info(
-            f"📊 Token 统计: 最小={stats.min_token_count}, "
-            f"最大={stats.max_token_count}, 平均={stats.avg_token_count:.1f}"
+        pipeline = UnifiedPipeline(
+            output_format=OutputFormat.HTML,
+            keywords=self.keywords,
+            max_rows_per_chunk=self.max_rows_per_chunk,
+            target_tokens=self.target_tokens,
+            separator=self.separator,
+            keep_formulas=self.keep_formulas,
         )
-
-        if result.warnings:
-            logger.warning(f"有 {len(result.warnings)} 个片段超过 token 限制：")
-            for w in result.warnings:
-                logger.warning(
-                    f"   - 片段 #{w.chunk_index}: {w.actual_tokens} tokens (超出 {w.overflow})"
-                )
-                logger.warning(f"     原因: {w.reason}")
-
-    def _save_chunks(self, chunk_path: Path, result, html_path: Path) -> ConversionResult | None:
-        """保存切分结果"""
-        formatted_separator = f"\n\n{self.separator}\n\n"
-        merged_content = formatted_separator.join(result.chunks)
-
-        try:
-            chunk_path.write_text(merged_content, encoding="utf-8")
-            logger.info(f"✅ Chunk 文件已保存: {chunk_path.absolute()}")
-        except OSError as e:
-            logger.error(f"写入 Chunk 文件失败: {e}")
-            return None
-
-        self._log_completion(html_path, chunk_path, result)
-
-        return ConversionResult(
-            html_path=html_path,
-            chunk_path=chunk_path,
-            chunk_count=len(result.chunks),
-            status_message="处理完成",
-            success=True,
-        )
-
-    def _log_completion(self, html_path: Path, chunk_path: Path, result) -> None:
-        """记录完成日志"""
-        logger.info("=" * 50)
-        logger.info("🎉 流水线执行完成！")
-        logger.info(f"   📄 中间结果 (HTML): {html_path}")
-        logger.info(f"   📄 最终结果 (Chunks): {chunk_path}")
-        logger.info(f"   🔢 Chunk 数量: {len(result.chunks)}")
-        logger.info(f"   🔑 分隔符: {self.separator}")
-        logger.info("=" * 50)
+        return pipeline.run(excel_path)
 
 
 def run_pipeline(
@@ -153,6 +46,7 @@ def run_pipeline(
     max_rows_per_chunk: int | None = None,
     target_tokens: int = 1024,
     separator: str = "!!!_CHUNK_BREAK_!!!",
+    keep_formulas: bool = False,
 ) -> dict | None:
     """执行完整的 Excel -> HTML -> Chunks 流水线（兼容旧接口）"""
     pipeline = ConversionPipeline(
@@ -160,6 +54,7 @@ def run_pipeline(
         max_rows_per_chunk=max_rows_per_chunk,
         target_tokens=target_tokens,
         separator=separator,
+        keep_formulas=keep_formulas,
     )
 
     result = pipeline.run(Path(excel_path))
@@ -188,6 +83,9 @@ def main() -> None:
   python pipeline.py input.xlsx -t 1024
   python pipeline.py input.xlsx -r 5
   python pipeline.py input.xlsx -t 2048 -s "---SPLIT---"
+  python pipeline.py input.xlsx --keep-formulas
+  python pipeline.py a.xlsx b.xlsx c.xlsx -j 2
+  python pipeline.py *.xlsx -q
         """,
     )
     parser.add_argument("excel_file", nargs="+", help="要转换的 Excel 文件路径（支持多个）")
@@ -219,6 +117,27 @@ def main() -> None:
         default="!!!_CHUNK_BREAK_!!!",
         help="chunk 之间的分隔符",
     )
+    parser.add_argument(
+        "--keep-formulas",
+        action="store_true",
+        help=(
+            "输出公式原文而非缓存的计算值（加载更慢）；"
+            "未保存计算结果的文件（如程序生成）需使用此选项，否则公式单元格为空"
+        ),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="批量处理的并行进程数（默认: CPU 核数；1 表示顺序处理，便于调试）",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="只输出警告和错误日志（批量处理时减少日志开销）",
+    )
     # CSV 特定参数
     parser.add_argument(
         "--delimiter",
@@ -232,29 +151,53 @@ def main() -> None:
     )
 
     args = parser.parse_args()
-
-    # 批量处理多个文件
-    for excel_file in args.excel_file:
-        if args.format == "html":
-            run_pipeline(
-                excel_path=excel_file,
-                keywords=args.keywords,
-                max_rows_per_chunk=args.max_rows,
-                target_tokens=args.target_tokens,
-                separator=args.separator,
-            )
-        else:
-            from ..unified_pipeline import run_unified_pipeline
-            run_unified_pipeline(
-                excel_path=excel_file,
-                output_format=args.format,
-                keywords=args.keywords,
-                max_rows_per_chunk=args.max_rows,
-                target_tokens=args.target_tokens,
-                separator=args.separator,
-                csv_delimiter=args.delimiter,
-                csv_encoding=args.encoding,
-            )
+    excel_files: list[str] = args.excel_file
+    _configure_logging(args.quiet)
+
+    max_workers = min(len(excel_files), args.jobs or os.cpu_count() or 1)
+    if max_workers <= 1:
+        for excel_file in excel_files:
+            _run_one(excel_file, args)
+        return
+
+    # 批量处理：各文件互不依赖，按进程并行（子进程同样应用日志级别）
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_configure_logging, initargs=(args.quiet,)
+    ) as executor:
+        # 文件很多时按批派发，减少进程间往返；每个 worker 仍能分到约 4 批以均衡负载
+        chunksize = max(1, len(excel_files) // (4 * max_workers))
+        list(executor.map(partial(_run_one, args=args), excel_files, chunksize=chunksize))
+
+
+def _configure_logging(quiet: bool) -> None:
+    """安静模式下只保留警告及以上级别的日志"""
+    if quiet:
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+
+
+def _run_one(excel_file: str, args: argparse.Namespace) -> None:
+    """处理单个文件（进程池工作函数，需定义在模块级以便序列化）"""
+    if args.format == "html":
+        run_pipeline(
+            excel_path=excel_file,
+            keywords=args.keywords,
+            max_rows_per_chunk=args.max_rows,
+            target_tokens=args.target_tokens,
+            separator=args.separator,
+            keep_formulas=args.keep_formulas,
+        )
+    else:
+        from ..unified_pipeline import run_unified_pipeline
+        run_unified_pipeline(
+            excel_path=excel_file,
+            output_format=args.format,
+            keywords=args.keywords,
+            max_rows_per_chunk=args.max_rows,
+            target_tokens=args.target_tokens,
+            separator=args.separator,
+            keep_formulas=args.keep_formulas,
+        )
 
 
 if __name__ == "__main__":
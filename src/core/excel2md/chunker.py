@@ -6,19 +6,26 @@ Markdown 切分器
 
 import json
 import re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from loguru import logger
 
 from ..models import ChunkConfig, ChunkResult, ChunkStats, ChunkWarning, SplitMode
+from ..tokenizer import estimate_tokens, estimate_tokens_batch
 
 # 类型别名
 type NotesDict = dict[str, str]
 
+# 注释引用
+_REF_MULTI_RE = re.compile(r"\[(注)([\d、,，]+)\]")
+_REF_NUM_SEP_RE = re.compile(r"[、,，]")
+_REF_BRACKET_RE = re.compile(r"\[(注\s*\d*|备注\s*\d*|说明\s*\d*|注意\s*\d*)\s*\]")
+_REF_SUPERSCRIPT_RE = re.compile(r"[^\[](注\d+)(?:[：:）\)]|$|\s)")
 
-def estimate_tokens(text: str) -> int:
-    """估算文本的 token 数量（中文约2.5字符=1token）"""
-    return int(len(text) / 2.5)
+# 表格结构：front matter 围栏行，以及去掉行首空白后以 "|" / "<!--" 开头的整行
+_MD_FENCE_RE = re.compile(r"^[^\S\n]*---[^\S\n]*$", re.M)
+_MD_TABLE_LINE_RE = re.compile(r"^[^\S\n]*\|[^\n]*", re.M)
+_MD_COMMENT_LINE_RE = re.compile(r"^[^\S\n]*<!--[^\n]*", re.M)
 
 
 @dataclass
@@ -26,9 +33,14 @@ class MarkdownChunker:
     """Markdown 切分器"""
 
     config: ChunkConfig
+    # 命中的条件注释键集合 -> 注释开销 token 数
+    _notes_overhead_cache: dict[frozenset[str], int] = field(
+        default_factory=dict, init=False, repr=False
+    )
 
     def chunk(self, md_content: str) -> ChunkResult:
         """切分 Markdown 内容"""
+        self._notes_overhead_cache.clear()
         # 解析 MD 结构
         front_matter, header_line, separator_line, data_lines, header_notes, conditional_notes = (
             self._parse_md_table(md_content)
@@ -42,54 +54,146 @@ class MarkdownChunker:
                 stats=ChunkStats(total_chunks=1, oversized_chunks=0),
             )
 
-        # 提取表头文本用于注释匹配
-        header_text = header_line
+        # 表头引用只提取一次，数据行引用随行增量合并
+        has_notes = bool(header_notes or conditional_notes)
+        header_refs = self._extract_note_references(header_line) if has_notes else set()
+
+        # 每个 chunk 共用的 front matter 行和表头行只生成一次
+        front_lines = self._render_front_matter(front_matter)
+        table_head = [line for line in (header_line, separator_line) if line]
 
         # 计算固定开销（front matter + 表头）
-        fixed_overhead = self._estimate_fixed_overhead(front_matter, header_line, separator_line)
+        fixed_overhead = self._estimate_fixed_overhead(front_matter, front_lines, table_head)
+        # 拼接 chunk 时只需在两段固定文本之间插入注释行和数据行
+        front_head = "\n".join(["---", *front_lines])
+        table_head_text = "\n".join(table_head)
+
+        # 切分数据行：按行数切分时无需逐行计算 token 和注释开销
+        if self.config.split_mode == SplitMode.BY_ROWS and self.config.max_rows:
+            chunks, token_counts = self._chunk_by_rows(
+                data_lines, front_head, table_head_text,
+                header_notes, conditional_notes, header_refs, fixed_overhead,
+            )
+            warnings: list[ChunkWarning] = []
+        else:
+            chunks, token_counts, warnings = self._chunk_by_tokens(
+                data_lines, front_head, table_head_text,
+                header_notes, conditional_notes, header_refs, fixed_overhead,
+            )
+
+        # 计算统计信息
+        stats = self._calculate_stats(token_counts, warnings, fixed_overhead)
+
+        return ChunkResult(chunks=chunks, warnings=warnings, stats=stats)
+
+    def _chunk_by_rows(
+        self,
+        data_lines: list[str],
+        front_head: str,
+        table_head: str,
+        header_notes: NotesDict,
+        conditional_notes: NotesDict,
+        header_refs: set[str],
+        fixed_overhead: int,
+    ) -> tuple[list[str], list[int]]:
+        """按行数切分：直接按 max_rows 分组，token 数只用于统计"""
+        has_notes = bool(header_notes or conditional_notes)
+        max_rows = self.config.max_rows
+        line_tokens = estimate_tokens_batch(data_lines)
+        chunks: list[str] = []
+        token_counts: list[int] = []
+        for start in range(0, len(data_lines), max_rows):
+            group = data_lines[start : start + max_rows]
+            chunk_refs = set(header_refs)
+            if has_notes:
+                for line in group:
+                    chunk_refs |= self._extract_note_references(line)
+            notes_overhead = self._calculate_notes_overhead(
+                chunk_refs, header_notes, conditional_notes
+            )
+            token_counts.append(
+                sum(line_tokens[start : start + max_rows]) + fixed_overhead + notes_overhead
+            )
+            chunks.append(
+                self._build_chunk(
+                    front_head, table_head, group, header_notes, conditional_notes, chunk_refs
+                )
+            )
+        return chunks, token_counts
 
-        # 切分数据行
+    def _chunk_by_tokens(
+        self,
+        data_lines: list[str],
+        front_head: str,
+        table_head: str,
+        header_notes: NotesDict,
+        conditional_notes: NotesDict,
+        header_refs: set[str],
+        fixed_overhead: int,
+    ) -> tuple[list[str], list[int], list[ChunkWarning]]:
+        """按 token 数切分"""
+        has_notes = bool(header_notes or conditional_notes)
+        # 配置在循环外读取一次；按行数切分已由 _chunk_by_rows 处理，此处只看 token 上限
+        by_tokens = self.config.split_mode == SplitMode.BY_TOKENS
+        max_tokens = self.config.max_tokens if by_tokens else None
         chunks: list[str] = []
+        # 每个 chunk 的 token 数在切分时已知（数据行 + 固定开销 + 注释开销），无需再编码成品
+        token_counts: list[int] = []
         warnings: list[ChunkWarning] = []
         current_chunk: list[str] = []
         current_tokens = fixed_overhead
+        # 注释开销随引用滚动维护，只在命中新的条件注释时重算
+        chunk_refs = set(header_refs)
+        header_overhead = self._calculate_notes_overhead(
+            chunk_refs, header_notes, conditional_notes
+        )
+        notes_overhead = header_overhead
 
-        for i, line in enumerate(data_lines):
-            line_tokens = estimate_tokens(line)
+        for line, line_tokens in zip(data_lines, estimate_tokens_batch(data_lines), strict=True):
+            line_refs = self._extract_note_references(line) if has_notes else set()
 
             # 计算加入新行后的注释开销
-            test_chunk = current_chunk + [line]
-            notes_overhead = self._calculate_notes_overhead(
-                test_chunk, header_notes, conditional_notes, header_text
+            line_overhead = self._grow_notes_overhead(
+                chunk_refs, line_refs, notes_overhead, header_notes, conditional_notes
             )
 
-            if current_chunk and self._should_split(
-                len(current_chunk), current_tokens + line_tokens + notes_overhead
+            if (
+                current_chunk
+                and max_tokens
+                and current_tokens + line_tokens + line_overhead > max_tokens
             ):
+                token_counts.append(current_tokens + notes_overhead)
                 chunks.append(
                     self._build_chunk(
-                        front_matter, header_line, separator_line, current_chunk,
-                        header_notes, conditional_notes, header_text
+                        front_head, table_head, current_chunk,
+                        header_notes, conditional_notes, chunk_refs
                     )
                 )
                 current_chunk = []
                 current_tokens = fixed_overhead
+                chunk_refs = set(header_refs)
+                line_overhead = self._grow_notes_overhead(
+                    chunk_refs, line_refs, header_overhead, header_notes, conditional_notes
+                )
 
             current_chunk.append(line)
             current_tokens += line_tokens
+            chunk_refs |= line_refs
+            notes_overhead = line_overhead
 
             # 检查单行是否超限
-            if self.config.split_mode == SplitMode.BY_TOKENS and self.config.max_tokens:
-                single_notes_overhead = self._calculate_notes_overhead(
-                    [line], header_notes, conditional_notes, header_text
+            if max_tokens:
+                single_notes_overhead = self._grow_notes_overhead(
+                    header_refs, line_refs, header_overhead, header_notes, conditional_notes
                 )
-                if line_tokens + fixed_overhead + single_notes_overhead > self.config.max_tokens:
+                single_total = line_tokens + fixed_overhead + single_notes_overhead
+                if single_total > max_tokens:
                     warnings.append(
                         ChunkWarning(
                             chunk_index=len(chunks),
-                            actual_tokens=line_tokens + fixed_overhead + single_notes_overhead,
-                            limit=self.config.max_tokens,
-                            overflow=line_tokens + fixed_overhead + single_notes_overhead - self.config.max_tokens,
+                            actual_tokens=single_total,
+                            limit=max_tokens,
+                            overflow=single_total - max_tokens,
                             row_count=1,
                             reason="单行数据 + 注释超过 token 限制",
                         )
@@ -97,197 +201,190 @@ class MarkdownChunker:
 
         # 处理最后一个 chunk
         if current_chunk:
+            token_counts.append(current_tokens + notes_overhead)
             chunks.append(
                 self._build_chunk(
-                    front_matter, header_line, separator_line, current_chunk,
-                    header_notes, conditional_notes, header_text
+                    front_head, table_head, current_chunk,
+                    header_notes, conditional_notes, chunk_refs
                 )
             )
 
-        # 计算统计信息
-        stats = self._calculate_stats(chunks, warnings, fixed_overhead)
-
-        return ChunkResult(chunks=chunks, warnings=warnings, stats=stats)
+        return chunks, token_counts, warnings
 
     def _parse_md_table(
         self, md_content: str
     ) -> tuple[dict[str, str], str | None, str | None, list[str], NotesDict, NotesDict]:
         """解析 Markdown 表格结构，包括 YAML front matter"""
-        lines = md_content.split("\n")
-
         front_matter: dict[str, str] = {}
-        header_line: str | None = None
-        separator_line: str | None = None
-        data_lines: list[str] = []
-        header_notes: NotesDict = {}
-        conditional_notes: NotesDict = {}
-
-        in_front_matter = False
-        front_matter_done = False
-
-        for line in lines:
-            stripped = line.strip()
-
-            # 解析 YAML front matter
-            if stripped == "---" and not front_matter_done:
-                if not in_front_matter:
-                    in_front_matter = True
-                    continue
-                else:
-                    in_front_matter = False
-                    front_matter_done = True
-                    continue
-
-            if in_front_matter:
-                if ":" in stripped:
-                    key, _, value = stripped.partition(":")
-                    front_matter[key.strip()] = value.strip()
-                    # 提取注释元数据
-                    if key.strip() == "notes_meta":
-                        try:
-                            notes_meta = json.loads(value.strip())
-                            header_notes = notes_meta.get("header_notes", {})
-                            conditional_notes = notes_meta.get("conditional_notes", {})
-                        except json.JSONDecodeError:
-                            pass
+        table_lines: list[str] = []
+        notes: tuple[NotesDict, NotesDict] = ({}, {})
+
+        # 首个 --- 围栏到下一个围栏之间是 front matter（未闭合则延续到文末），
+        # 其余部分由正则一次扫描出表格行和注释行，不再逐行 strip
+        fence = _MD_FENCE_RE.search(md_content)
+        if fence is None:
+            notes = self._scan_table_lines(md_content, table_lines) or notes
+        else:
+            closing = _MD_FENCE_RE.search(md_content, fence.end())
+            front_end = closing.start() if closing else len(md_content)
+            body_start = closing.end() if closing else len(md_content)
+            notes = self._scan_table_lines(md_content[: fence.start()], table_lines) or notes
+            front_text = md_content[fence.end() : front_end]
+            notes = self._parse_front_matter(front_text, front_matter) or notes
+            notes = self._scan_table_lines(md_content[body_start:], table_lines) or notes
+
+        header_line, separator_line, data_lines = self._split_table_lines(table_lines)
+        return front_matter, header_line, separator_line, data_lines, *notes
+
+    def _parse_front_matter(
+        self, text: str, front_matter: dict[str, str]
+    ) -> tuple[NotesDict, NotesDict] | None:
+        """解析 front matter 键值行，返回其中的注释元数据"""
+        notes = None
+        for line in text.split("\n"):
+            key, sep, value = line.strip().partition(":")
+            if not sep:
                 continue
-
-            # 兼容旧的 HTML 注释格式
-            if stripped.startswith("<!--"):
-                if "NOTES_META:" in stripped:
-                    try:
-                        json_start = stripped.index("NOTES_META:") + len("NOTES_META:")
-                        json_end = stripped.rindex("-->")
-                        json_str = stripped[json_start:json_end].strip()
-                        notes_meta = json.loads(json_str)
-                        header_notes = notes_meta.get("header_notes", {})
-                        conditional_notes = notes_meta.get("conditional_notes", {})
-                    except (ValueError, json.JSONDecodeError):
-                        pass
-                continue
-
-            if not stripped:
-                continue
-
-            if stripped.startswith("|") and header_line is None:
-                header_line = line
-            elif stripped.startswith("|") and separator_line is None and "---" in stripped:
-                separator_line = line
-            elif stripped.startswith("|"):
-                data_lines.append(line)
-
-        return front_matter, header_line, separator_line, data_lines, header_notes, conditional_notes
+            key, value = key.strip(), value.strip()
+            front_matter[key] = value
+            # 提取注释元数据
+            if key == "notes_meta":
+                notes = self._load_notes_meta(value) or notes
+        return notes
+
+    def _scan_table_lines(
+        self, text: str, table_lines: list[str]
+    ) -> tuple[NotesDict, NotesDict] | None:
+        """收集表格行，返回旧版 HTML 注释中的注释元数据"""
+        table_lines.extend(_MD_TABLE_LINE_RE.findall(text))
+        if "NOTES_META:" not in text:
+            return None
+
+        # 兼容旧的 HTML 注释格式
+        notes = None
+        for comment in _MD_COMMENT_LINE_RE.findall(text):
+            stripped = comment.strip()
+            if "NOTES_META:" in stripped:
+                try:
+                    json_start = stripped.index("NOTES_META:") + len("NOTES_META:")
+                    json_end = stripped.rindex("-->")
+                except ValueError:
+                    continue
+                notes = self._load_notes_meta(stripped[json_start:json_end].strip()) or notes
+        return notes
+
+    def _load_notes_meta(self, json_str: str) -> tuple[NotesDict, NotesDict] | None:
+        """解析注释元数据 JSON"""
+        try:
+            notes_meta = json.loads(json_str)
+        except json.JSONDecodeError:
+            return None
+        return notes_meta.get("header_notes", {}), notes_meta.get("conditional_notes", {})
+
+    def _split_table_lines(
+        self, table_lines: list[str]
+    ) -> tuple[str | None, str | None, list[str]]:
+        """拆分表头行、分隔行和数据行"""
+        if not table_lines:
+            return None, None, []
+        header_line = table_lines[0]
+        rest = table_lines[1:]
+        for index, line in enumerate(rest):
+            if "---" in line:
+                return header_line, line, rest[:index] + rest[index + 1 :]
+        return header_line, None, rest
+
+    def _render_front_matter(self, front_matter: dict[str, str]) -> list[str]:
+        """生成 front matter 内容行（不含 notes_meta）"""
+        return [f"{key}: {value}" for key, value in front_matter.items() if key != "notes_meta"]
 
     def _estimate_fixed_overhead(
-        self, front_matter: dict[str, str], header: str | None, separator: str | None
+        self, front_matter: dict[str, str], front_lines: list[str], table_head: list[str]
     ) -> int:
         """估算固定开销的 token 数"""
-        parts = []
-        # front matter（不含 notes_meta）
-        if front_matter:
-            parts.append("---")
-            for key, value in front_matter.items():
-                if key != "notes_meta":
-                    parts.append(f"{key}: {value}")
-            parts.append("---")
-        if header:
-            parts.append(header)
-        if separator:
-            parts.append(separator)
+        parts = ["---", *front_lines, "---"] if front_matter else []
+        parts.extend(table_head)
         return estimate_tokens("\n".join(parts))
 
-    def _should_split(self, row_count: int, total_tokens: int) -> bool:
-        """判断是否应该切分"""
-        if self.config.split_mode == SplitMode.BY_TOKENS and self.config.max_tokens:
-            return total_tokens > self.config.max_tokens
-        elif self.config.split_mode == SplitMode.BY_ROWS and self.config.max_rows:
-            return row_count >= self.config.max_rows
-        return False
-
     def _build_chunk(
         self,
-        front_matter: dict[str, str],
-        header: str | None,
-        separator: str | None,
+        front_head: str,
+        table_head: str,
         data: list[str],
         header_notes: NotesDict,
         conditional_notes: NotesDict,
-        header_text: str,
+        chunk_refs: set[str],
     ) -> str:
-        """构建单个 chunk，包含匹配的注释"""
-        parts: list[str] = []
-
-        # 收集匹配的注释
-        chunk_text = " ".join(data)
-        all_text = chunk_text + " " + header_text
-        chunk_refs = self._extract_note_references(all_text)
-        matched_notes = self._collect_matched_notes(header_notes, conditional_notes, chunk_refs)
-
-        # 构建 YAML front matter
-        parts.append("---")
-        for key, value in front_matter.items():
-            if key != "notes_meta":
-                parts.append(f"{key}: {value}")
-        # 添加匹配的注释
-        if matched_notes:
-            notes_text = " | ".join(matched_notes)
-            parts.append(f"notes: {notes_text}")
-        parts.append("---")
-        parts.append("")
-
-        # 添加表头
-        if header:
-            parts.append(header)
-        if separator:
-            parts.append(separator)
+        """构建单个 chunk，包含匹配的注释（chunk_refs 已包含表头引用）"""
+        # 匹配的注释作为 front matter 的最后一行
+        notes_line = ""
+        if header_notes or conditional_notes:
+            matched_notes = self._collect_matched_notes(
+                header_notes, conditional_notes, chunk_refs
+            )
+            if matched_notes:
+                notes_text = " | ".join(matched_notes)
+                notes_line = f"\nnotes: {notes_text}"
 
-        # 添加数据行
-        parts.extend(data)
+        rows = "\n".join(data)
+        return f"{front_head}{notes_line}\n---\n\n{table_head}\n{rows}"
 
-        return "\n".join(parts)
+    def _grow_notes_overhead(
+        self,
+        chunk_refs: set[str],
+        new_refs: set[str],
+        notes_overhead: int,
+        header_notes: NotesDict,
+        conditional_notes: NotesDict,
+    ) -> int:
+        """加入新引用后的注释开销（未命中新的条件注释时沿用当前开销）"""
+        if new_refs <= chunk_refs or conditional_notes.keys().isdisjoint(new_refs - chunk_refs):
+            return notes_overhead
+        return self._calculate_notes_overhead(
+            chunk_refs | new_refs, header_notes, conditional_notes
+        )
 
     def _calculate_notes_overhead(
         self,
-        data_lines: list[str],
+        chunk_refs: set[str],
         header_notes: NotesDict,
         conditional_notes: NotesDict,
-        header_text: str,
     ) -> int:
-        """计算注释开销"""
+        """计算注释开销（同一组命中注释只计算一次）"""
         if not header_notes and not conditional_notes:
             return 0
 
-        chunk_text = " ".join(data_lines)
-        all_text = chunk_text + " " + header_text
-        chunk_refs = self._extract_note_references(all_text)
-        matched_notes = self._collect_matched_notes(header_notes, conditional_notes, chunk_refs)
-
-        if not matched_notes:
-            return 0
+        active_keys = frozenset(chunk_refs.intersection(conditional_notes))
+        overhead = self._notes_overhead_cache.get(active_keys)
+        if overhead is not None:
+            return overhead
 
-        notes_text = " | ".join(matched_notes)
-        return estimate_tokens(f"<!-- 表格注释: {notes_text} -->")
+        matched_notes = self._collect_matched_notes(header_notes, conditional_notes, chunk_refs)
+        overhead = 0
+        if matched_notes:
+            notes_text = " | ".join(matched_notes)
+            overhead = estimate_tokens(f"<!-- 表格注释: {notes_text} -->")
+        self._notes_overhead_cache[active_keys] = overhead
+        return overhead
 
     def _extract_note_references(self, text: str) -> set[str]:
         """从文本中提取注释引用"""
         refs: set[str] = set()
 
-        # 处理 Markdown 转义字符
-        text = text.replace(r"\[", "[").replace(r"\]", "]")
-
-        multi_refs = re.findall(r"\[(注)([\d、,，]+)\]", text)
-        for prefix, nums_str in multi_refs:
-            nums = re.split(r"[、,，]", nums_str)
-            for num in nums:
-                num = num.strip()
-                if num:
-                    refs.add(f"{prefix}{num}")
+        # 所有文字引用都含"注"或"说明"，绝大多数行可直接跳过正则扫描
+        if "注" in text or "说明" in text:
+            # 处理 Markdown 转义字符
+            text = text.replace(r"\[", "[").replace(r"\]", "]")
+            for prefix, nums_str in _REF_MULTI_RE.findall(text):
+                for num in _REF_NUM_SEP_RE.split(nums_str):
+                    num = num.strip()
+                    if num:
+                        refs.add(f"{prefix}{num}")
 
-        bracket_refs = re.findall(r"\[(注\s*\d*|备注\s*\d*|说明\s*\d*|注意\s*\d*)\s*\]", text)
-        refs.update(ref.replace(" ", "") for ref in bracket_refs)
+            bracket_refs = _REF_BRACKET_RE.findall(text)
+            refs.update(ref.replace(" ", "") for ref in bracket_refs)
 
-        superscript_refs = re.findall(r"[^\[](注\d+)(?:[：:）\)]|$|\s)", text)
-        refs.update(superscript_refs)
+            refs.update(_REF_SUPERSCRIPT_RE.findall(text))
 
         if "*" in text:
             refs.add("*")
@@ -302,32 +399,23 @@ class MarkdownChunker:
         conditional_notes: NotesDict,
         chunk_refs: set[str],
     ) -> list[str]:
-        """收集匹配的注释"""
-        matched_notes: list[str] = []
-        seen_notes: set[str] = set()
-
+        """收集匹配的注释（dict 按插入顺序去重）"""
         # 表头注释始终包含
-        for note in header_notes.values():
-            if note not in seen_notes:
-                matched_notes.append(note)
-                seen_notes.add(note)
+        matched_notes = dict.fromkeys(header_notes.values())
 
         # 条件注释按引用匹配
         for key, note in conditional_notes.items():
-            if key in chunk_refs and note not in seen_notes:
-                matched_notes.append(note)
-                seen_notes.add(note)
+            if key in chunk_refs:
+                matched_notes[note] = None
 
-        return matched_notes
+        return list(matched_notes)
 
     def _calculate_stats(
-        self, chunks: list[str], warnings: list[ChunkWarning], fixed_overhead: int
+        self, token_counts: list[int], warnings: list[ChunkWarning], fixed_overhead: int
     ) -> ChunkStats:
         """计算切分统计信息"""
-        token_counts = [estimate_tokens(chunk) for chunk in chunks]
-
         return ChunkStats(
-            total_chunks=len(chunks),
+            total_chunks=len(token_counts),
             oversized_chunks=len(warnings),
             token_counts=token_counts,
             max_token_count=max(token_counts) if token_counts else 0,
@@ -20,6 +20,23 @@ from loguru import logger
 
 from ..base_converter import BaseExcelConverter
 
+# Markdown 特殊字符转义表（逐字符映射，反斜杠不会被重复转义）
+_MD_ESCAPE_TABLE = str.maketrans(
+    {
+        "\\": "\\\\",
+        "|": "\\|",
+        "*": "\\*",
+        "_": "\\_",
+        "`": "\\`",
+        "[": "\\[",
+        "]": "\\]",
+        "\n": " ",
+        "\r": "",
+    }
+)
+# 绝大多数单元格不含特殊字符，先查找再转义
+_MD_SPECIAL_RE = re.compile(r"[\\|*_`\[\]\n\r]")
+
 
 @dataclass
 class MarkdownConverter(BaseExcelConverter):
@@ -48,15 +65,14 @@ class MarkdownConverter(BaseExcelConverter):
         flattened_headers: dict[int, str],
         header_rows: int,
         data_end_row: int,
+        footer_notes: list[str],
     ) -> str:
         """生成 Markdown 表格"""
         lines: list[str] = []
 
-        # 提取注释
-        footer_notes, _ = self._detect_footer_notes(sheet, header_rows)
-        notes_dict = self._parse_notes_with_keys(footer_notes)
-        header_text = " ".join(flattened_headers.values())
-        header_note_refs = self._extract_note_references(header_text)
+        # 注释（末尾注释行已在检测数据范围时提取）
+        headers = [flattened_headers.get(i, "") for i in range(1, self._max_col + 1)]
+        header_notes, conditional_notes = self._classify_notes(footer_notes, " ".join(headers))
 
         # 元数据块（YAML front matter 格式）
         if self.include_metadata:
@@ -66,118 +82,42 @@ class MarkdownConverter(BaseExcelConverter):
             if self.keywords:
                 lines.append(f"keywords: {', '.join(self.keywords)}")
             # 添加注释元数据
-            if notes_dict:
-                header_notes = {k: v for k, v in notes_dict.items() if k in header_note_refs}
-                other_notes = {k: v for k, v in notes_dict.items() if k not in header_note_refs}
-                notes_meta = {"header_notes": header_notes, "conditional_notes": other_notes}
+            if header_notes or conditional_notes:
+                notes_meta = {"header_notes": header_notes, "conditional_notes": conditional_notes}
                 notes_json = json.dumps(notes_meta, ensure_ascii=False)
                 lines.append(f"notes_meta: {notes_json}")
             lines.append("---")
             lines.append("")
 
         # 表头行
-        headers = [flattened_headers.get(i, "") for i in range(1, sheet.max_column + 1)]
         escaped_headers = [self._escape_md(h) for h in headers]
         lines.append("| " + " | ".join(escaped_headers) + " |")
 
         # 分隔行
         lines.append("| " + " | ".join(["---"] * len(headers)) + " |")
 
-        # 数据行
-        for row_idx in range(header_rows + 1, data_end_row + 1):
-            row_values = self._get_row_values(sheet, row_idx)
-            escaped_values = [self._escape_md(v) for v in row_values]
-            lines.append("| " + " | ".join(escaped_values) + " |")
+        # 数据行（方法查找提到循环外，每行只拼接一次）
+        escape_md = self._escape_md
+        get_row_values = self._get_row_values
+        data_rows = self._rows[header_rows:data_end_row]
+        for row_idx, row in enumerate(data_rows, start=header_rows + 1):
+            cells = " | ".join([escape_md(v) for v in get_row_values(row_idx, row)])
+            lines.append(f"| {cells} |")
 
         return "\n".join(lines)
 
-    def _parse_notes_with_keys(self, notes_list: list[str]) -> dict[str, str]:
-        """解析注释列表，提取注释编号和内容"""
-        notes_dict: dict[str, str] = {}
-        for note in notes_list:
-            note = note.strip()
-            if not note:
-                continue
-            split_pattern = r"(?=\[注[\d、,，]+\]|\[备注\d*\]|\[说明\d*\])"
-            parts = re.split(split_pattern, note)
-            parts = [p.strip() for p in parts if p.strip()]
-            if len(parts) > 1:
-                for part in parts:
-                    self._parse_single_note(part, notes_dict)
-            else:
-                self._parse_single_note(note, notes_dict)
-        return notes_dict
-
-    def _parse_single_note(self, note: str, notes_dict: dict[str, str]) -> None:
-        """解析单个注释"""
-        note = note.strip()
-        if not note:
-            return
-        multi_num_match = re.match(r"^\[(注)([\d、,，]+)\]", note)
-        if multi_num_match:
-            prefix = multi_num_match.group(1)
-            nums_str = multi_num_match.group(2)
-            nums = re.split(r"[、,，]", nums_str)
-            for num in nums:
-                num = num.strip()
-                if num:
-                    notes_dict[f"{prefix}{num}"] = note
-            return
-        bracket_match = re.match(r"^\[([注备说][注明意]?\d*)\]", note)
-        if bracket_match:
-            notes_dict[bracket_match.group(1)] = note
-            return
-        paren_match = re.match(r"^[（\(]([注备说][注明意]?\d*)[）\)]", note)
-        if paren_match:
-            notes_dict[paren_match.group(1)] = note
-            return
-        plain_match = re.match(r"^(注\d*|备注\d*|说明\d*|注意\d*)[：:．.、]?\s*", note)
-        if plain_match:
-            key_match = re.match(r"^(注\d*|备注\d*|说明\d*|注意\d*)", note)
-            if key_match:
-                notes_dict[key_match.group(1)] = note
-            return
-        if note[0] in "*※●◆△▲":
-            notes_dict[note[0]] = note
-            return
-        notes_dict[note[:10]] = note
-
-    def _extract_note_references(self, text: str) -> set[str]:
-        """从文本中提取注释引用"""
-        refs: set[str] = set()
-        multi_refs = re.findall(r"\[(注)([\d、,，]+)\]", text)
-        for prefix, nums_str in multi_refs:
-            nums = re.split(r"[、,，]", nums_str)
-            for num in nums:
-                num = num.strip()
-                if num:
-                    refs.add(f"{prefix}{num}")
-        bracket_refs = re.findall(r"\[(注\d*|备注\d*|说明\d*|注意\d*)\]", text)
-        refs.update(bracket_refs)
-        superscript_refs = re.findall(r"[^\[](注\d+)(?:[：:）\)]|$|\s)", text)
-        refs.update(superscript_refs)
-        if "*" in text:
-            refs.add("*")
-        if "※" in text:
-            refs.add("※")
-        return refs
-
-    def _join_sheets(self, sheet_contents: list[str]) -> str:
-        """合并多个 sheet 的内容"""
-        return self.sheet_separator.join(sheet_contents)
+    def _get_sheet_separator(self) -> str:
+        """返回 sheet 之间的分隔文本"""
+        return self.sheet_separator
 
     def _escape_md(self, text: str) -> str:
         """转义 Markdown 特殊字符"""
         if not text:
             return ""
-        # 转义顺序很重要：先转义反斜杠，再转义其他字符
-        text = text.replace("\\", "\\\\")
-        special_chars = ["|", "*", "_", "`", "[", "]"]
-        for char in special_chars:
-            text = text.replace(char, "\\" + char)
-        # 处理换行符，替换为空格
-        text = text.replace("\n", " ").replace("\r", "")
-        return text
+        if _MD_SPECIAL_RE.search(text) is None:
+            return text
+        # 单次扫描完成转义，换行符替换为空格
+        return text.translate(_MD_ESCAPE_TABLE)
 
 
 def convert_excel_to_md(
@@ -185,8 +125,11 @@ def convert_excel_to_md(
     keywords: list[str] | None = None,
     output_path: str | None = None,
     include_metadata: bool = True,
+    keep_formulas: bool = False,
 ) -> str | None:
     """将单个 Excel 文件转换为 Markdown（兼容函数接口）"""
-    converter = MarkdownConverter(keywords=keywords, include_metadata=include_metadata)
+    converter = MarkdownConverter(
+        keywords=keywords, include_metadata=include_metadata, keep_formulas=keep_formulas
+    )
     result = converter.convert(Path(excel_path), Path(output_path) if output_path else None)
     return str(result) if result else None
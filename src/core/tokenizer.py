@@ -0,0 +1,29 @@
+"""
+Token 计数模块
+HTML / Markdown 切分器共用的 tiktoken 编码器
+"""
+
+import os
+from functools import cache, lru_cache
+
+import tiktoken
+
+_ENCODING_NAME = "cl100k_base"
+
+
+@cache
+def get_encoding() -> tiktoken.Encoding:
+    """懒加载 tokenizer（每个进程只加载一次）"""
+    return tiktoken.get_encoding(_ENCODING_NAME)
+
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text: str) -> int:
+    """计算 token 数量（按文本缓存，表头、上下文、注释等重复文本只编码一次）"""
+    return len(get_encoding().encode_ordinary(text))
+
+
+def estimate_tokens_batch(texts: list[str]) -> list[int]:
+    """批量计算 token 数量（在 tiktoken 的线程池中并行编码，释放 GIL）"""
+    encoded = get_encoding().encode_ordinary_batch(texts, num_threads=os.cpu_count() or 1)
+    return [len(token_ids) for token_ids in encoded]
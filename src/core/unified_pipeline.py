@@ -11,6 +11,9 @@ from loguru import logger
 from .base_converter import BaseExcelConverter
 from .models import ChunkConfig, ConversionResult, OutputFormat, SplitMode
 
+# chunk 文件写缓冲（1 MiB），大量小 chunk 合并为少量系统调用
+_WRITE_BUFFER_SIZE = 1 << 20
+
 
 @dataclass
 class UnifiedPipeline:
@@ -21,6 +24,7 @@ class UnifiedPipeline:
     max_rows_per_chunk: int | None = None
     target_tokens: int = 1024
     separator: str = "!!!_CHUNK_BREAK_!!!"
+    keep_formulas: bool = False
 
     # MD 特定选项
     md_include_metadata: bool = True
@@ -57,27 +61,30 @@ class UnifiedPipeline:
         """创建对应格式的转换器"""
         if self.output_format == OutputFormat.HTML:
             from .excel2html.converter import ExcelToHtmlConverter
-            return ExcelToHtmlConverter(keywords=self.keywords)
+            return ExcelToHtmlConverter(keywords=self.keywords, keep_formulas=self.keep_formulas)
         else:
             from .excel2md.converter import MarkdownConverter
             return MarkdownConverter(
                 keywords=self.keywords,
                 include_metadata=self.md_include_metadata,
+                keep_formulas=self.keep_formulas,
             )
 
     def _process_with_chunking(self, output_path: Path, source_path: Path) -> ConversionResult | None:
         """处理需要切分的格式"""
         logger.info("📌 第二步：切分为 Chunks")
 
-        content = output_path.read_text(encoding="utf-8")
         config = self._build_chunk_config()
 
         if self.output_format == OutputFormat.HTML:
             from .excel2html.chunker import HtmlChunker
             chunker = HtmlChunker(config=config)
+            # lxml 直接解析 UTF-8 字节，省去整份文档解码为 str 的拷贝
+            content = output_path.read_bytes()
         else:
             from .excel2md.chunker import MarkdownChunker
             chunker = MarkdownChunker(config=config)
+            content = output_path.read_text(encoding="utf-8")
 
         result = chunker.chunk(content)
         self._log_chunk_result(result)
@@ -108,9 +115,12 @@ class UnifiedPipeline:
         """记录切分结果"""
         stats = result.stats
         logger.info(f"🔪 切分完成：共生成 {stats.total_chunks} 个片段")
+        # 参数由 loguru 延迟格式化，日志级别被过滤时不做格式化
         logger.info(
-            f"📊 Token 统计: 最小={stats.min_token_count}, "
-            f"最大={stats.max_token_count}, 平均={stats.avg_token_count:.1f}"
+            "📊 Token 统计: 最小={}, 最大={}, 平均={:.1f}",
+            stats.min_token_count,
+            stats.max_token_count,
+            stats.avg_token_count,
         )
 
         if result.warnings:
@@ -124,10 +134,14 @@ class UnifiedPipeline:
     def _save_chunks(self, chunk_path: Path, result, output_path: Path) -> ConversionResult | None:
         """保存切分结果"""
         formatted_separator = f"\n\n{self.separator}\n\n"
-        merged_content = formatted_separator.join(result.chunks)
 
         try:
-            chunk_path.write_text(merged_content, encoding="utf-8")
+            # 逐个写入 chunk，避免在内存中再拼出一份完整文档
+            with chunk_path.open("w", encoding="utf-8", buffering=_WRITE_BUFFER_SIZE) as f:
+                for index, chunk in enumerate(result.chunks):
+                    if index:
+                        f.write(formatted_separator)
+                    f.write(chunk)
             logger.info(f"✅ Chunk 文件已保存: {chunk_path.absolute()}")
         except OSError as e:
             logger.error(f"写入 Chunk 文件失败: {e}")
@@ -163,6 +177,7 @@ def run_unified_pipeline(
     max_rows_per_chunk: int | None = None,
     target_tokens: int = 1024,
     separator: str = "!!!_CHUNK_BREAK_!!!",
+    keep_formulas: bool = False,
 ) -> dict | None:
     """执行统一流水线（兼容函数接口）"""
     format_map = {
@@ -179,6 +194,7 @@ def run_unified_pipeline(
         max_rows_per_chunk=max_rows_per_chunk,
         target_tokens=target_tokens,
         separator=separator,
+        keep_formulas=keep_formulas,
     )
 
     result = pipeline.run(Path(excel_path))
@@ -0,0 +1,158 @@
+"""
+BaseExcelConverter 共享逻辑测试
+"""
+
+import re
+import zipfile
+import zlib
+from pathlib import Path
+
+import openpyxl
+import pytest
+from loguru import logger
+from lxml import etree
+
+from src.core.excel2md.converter import MarkdownConverter
+
+
+def _make_merged_workbook(path: Path) -> Path:
+    """生成含合并单元格的工作簿"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["分类", None, "数量"])
+    sheet.append(["A", "a1", 1])
+    sheet.append([None, "a2", 2])
+    sheet.merge_cells("A1:B1")
+    sheet.merge_cells("A2:A3")
+    workbook.save(path)
+    return path
+
+
+def _merged_refs(converter: MarkdownConverter, path: Path) -> list[str]:
+    """按转换流程读取第一个 sheet 的合并区域"""
+    converter._source_path = path
+    workbook = openpyxl.load_workbook(str(path), read_only=True)
+    try:
+        return sorted(r.coord for r in converter._read_merged_ranges(workbook.worksheets[0]))
+    finally:
+        workbook.close()
+
+
+def test_read_merged_ranges_streams_xml(tmp_path: Path):
+    path = _make_merged_workbook(tmp_path / "merged.xlsx")
+    assert _merged_refs(MarkdownConverter(), path) == ["A1:B1", "A2:A3"]
+
+
+@pytest.mark.parametrize(
+    "error",
+    [AttributeError("_get_source"), etree.XMLSyntaxError("bad xml", None, 1, 1)],
+)
+def test_read_merged_ranges_falls_back_to_full_load(tmp_path: Path, monkeypatch, error):
+    path = _make_merged_workbook(tmp_path / "merged.xlsx")
+
+    def broken_scan(_self, _sheet):
+        raise error
+
+    monkeypatch.setattr(MarkdownConverter, "_scan_sheet_xml", broken_scan)
+    assert _merged_refs(MarkdownConverter(), path) == ["A1:B1", "A2:A3"]
+
+
+def test_classify_unnumbered_notes_as_header_notes():
+    # 两条注释前 10 个字符相同，键必须按全文区分
+    first = "本表数据来源于海关总署二〇二三年统计公报"
+    second = "本表数据来源于海关总署二〇二四年统计公报"
+    assert first[:10] == second[:10]
+
+    header_notes, conditional_notes = MarkdownConverter()._classify_notes(
+        ["注1：单位为万元", "[注2]仅适用于配额内", first, second], "税率[注1]"
+    )
+
+    assert conditional_notes == {"注2": "[注2]仅适用于配额内"}
+    assert header_notes == {
+        "注1": "注1：单位为万元",
+        f"note-{zlib.crc32(first.encode()):08x}": first,
+        f"note-{zlib.crc32(second.encode()):08x}": second,
+    }
+    unnumbered_keys = [key for key in header_notes if key.startswith("note-")]
+    assert all(re.fullmatch(r"note-[0-9a-f]{8}", key) for key in unnumbered_keys)
+
+
+def _make_formula_workbook(path: Path, cached_value: str | None = None) -> Path:
+    """生成含公式的工作簿；openpyxl 不计算公式，cached_value 用于写入缓存值"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["名称", "甲", "乙", "合计"])
+    sheet.append(["a", 1, 2, "=B2+C2"])
+    workbook.save(path)
+    if cached_value is not None:
+        with zipfile.ZipFile(path) as archive:
+            members = {name: archive.read(name) for name in archive.namelist()}
+        sheet_xml = "xl/worksheets/sheet1.xml"
+        members[sheet_xml] = members[sheet_xml].replace(
+            b"<v></v>", f"<v>{cached_value}</v>".encode()
+        )
+        with zipfile.ZipFile(path, "w") as archive:
+            for name, data in members.items():
+                archive.writestr(name, data)
+    return path
+
+
+def _convert_md(path: Path, keep_formulas: bool) -> tuple[str, list[str]]:
+    """转换为 Markdown，返回 (输出内容, 警告日志)"""
+    warnings: list[str] = []
+    sink_id = logger.add(warnings.append, level="WARNING", format="{message}")
+    try:
+        out_path = MarkdownConverter(keep_formulas=keep_formulas).convert(
+            path, path.with_suffix(".md")
+        )
+    finally:
+        logger.remove(sink_id)
+    return out_path.read_text(encoding="utf-8"), warnings
+
+
+def test_formula_without_cached_value_is_empty_and_warns(tmp_path: Path):
+    path = _make_formula_workbook(tmp_path / "formula.xlsx")
+    output, warnings = _convert_md(path, keep_formulas=False)
+
+    assert output.splitlines()[-1] == "| a | 1 | 2 |  |"
+    assert len(warnings) == 1
+    assert "1 个公式单元格没有缓存的计算值" in warnings[0]
+    assert "--keep-formulas" in warnings[0]
+
+
+def test_formula_with_cached_value(tmp_path: Path):
+    path = _make_formula_workbook(tmp_path / "formula.xlsx", cached_value="3")
+    output, warnings = _convert_md(path, keep_formulas=False)
+
+    assert output.splitlines()[-1] == "| a | 1 | 2 | 3 |"
+    assert warnings == []
+
+
+def test_keep_formulas_outputs_formula_text(tmp_path: Path):
+    path = _make_formula_workbook(tmp_path / "formula.xlsx")
+    output, warnings = _convert_md(path, keep_formulas=True)
+
+    assert output.splitlines()[-1] == "| a | 1 | 2 | =B2+C2 |"
+    assert warnings == []
+
+
+@pytest.mark.parametrize(
+    ("cached_value", "keep_formulas", "expected_warnings"),
+    [(None, False, 1), ("3", False, 0), (None, True, 0)],
+    ids=["uncached", "cached", "keep_formulas"],
+)
+def test_full_load_fallback_checks_formula_cache(
+    tmp_path: Path, monkeypatch, cached_value, keep_formulas, expected_warnings
+):
+    path = _make_formula_workbook(tmp_path / "formula.xlsx", cached_value=cached_value)
+
+    def broken_scan(_self, _sheet):
+        raise etree.XMLSyntaxError("bad xml", None, 1, 1)
+
+    monkeypatch.setattr(MarkdownConverter, "_scan_sheet_xml", broken_scan)
+    _, warnings = _convert_md(path, keep_formulas=keep_formulas)
+    formula_warnings = [w for w in warnings if "没有缓存的计算值" in w]
+
+    assert len(formula_warnings) == expected_warnings
+    if expected_warnings:
+        assert "1 个公式单元格" in formula_warnings[0]
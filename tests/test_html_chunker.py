@@ -0,0 +1,204 @@
+"""
+HtmlChunker 切分测试
+"""
+
+import json
+
+import pytest
+from lxml import etree
+
+from src.core.excel2html.chunker import HtmlChunker
+from src.core.models import ChunkConfig, SplitMode, TokenStrategy
+
+_NOTES_META = {
+    "header_notes": {"注1": "注1：单位为万元"},
+    "conditional_notes": {"注2": "注2：仅适用于第二行"},
+}
+
+
+def _build_html(rows: list[str], notes_meta: dict | None = None) -> str:
+    """拼接转换器输出格式的 HTML"""
+    script = ""
+    if notes_meta:
+        script = (
+            '<script type="application/json" class="table-notes-meta">'
+            f"{json.dumps(notes_meta, ensure_ascii=False)}</script>"
+        )
+    body = "".join(rows)
+    return (
+        '<div class="rag-context">【文档上下文】来源：test.xlsx</div>'
+        f'<table data-source="test.xlsx" data-sheet="Sheet1">{script}'
+        "<thead><tr><th>列1</th><th>列2</th></tr></thead>"
+        f"<tbody>{body}</tbody></table>"
+    )
+
+
+def _same_rows(count: int) -> list[str]:
+    """内容完全相同的数据行（每行 token 数一致）"""
+    return ["<tr><td>数据</td><td>数值</td></tr>"] * count
+
+
+def _body_rows(chunk: str) -> list:
+    """chunk 中 tbody 的数据行"""
+    root = etree.fromstring(chunk, etree.HTMLParser())
+    return root.findall(".//tbody/tr")
+
+
+def _context_text(chunk: str) -> str:
+    """chunk 中上下文 div 的文本"""
+    root = etree.fromstring(chunk, etree.HTMLParser())
+    return root.find(".//div/div").xpath("string()")
+
+
+def _rows_chunker(max_rows: int) -> HtmlChunker:
+    """按行数切分的 chunker（max_tokens 为空时才按行数判断）"""
+    config = ChunkConfig(split_mode=SplitMode.BY_ROWS, max_tokens=None, max_rows=max_rows)
+    return HtmlChunker(config)
+
+
+def test_normalize_spans_fills_covered_cells():
+    html = _build_html(
+        [
+            '<tr><td rowspan="2">A</td><td colspan="2">B</td></tr>',
+            "<tr><td>C</td><td>D</td></tr>",
+        ]
+    )
+    result = HtmlChunker(ChunkConfig(max_tokens=None, max_rows=10)).chunk(html)
+    first, second = _body_rows(result.chunks[0])
+
+    assert [cell.text for cell in first] == ["A", "B", "B"]
+    assert [cell.text for cell in second] == ["A", "C", "D"]
+    assert first[2].get("class") == "span-fill"
+    assert second[0].get("class") == "span-fill"
+    for cell in (*first, *second):
+        assert cell.get("rowspan") is None and cell.get("colspan") is None
+    assert first[0].get("class") is None
+
+
+def test_span_fill_keeps_existing_class():
+    html = _build_html(['<tr><td class="num" colspan="2">1</td></tr>'])
+    result = HtmlChunker(ChunkConfig(max_tokens=None, max_rows=10)).chunk(html)
+    (row,) = _body_rows(result.chunks[0])
+
+    assert [cell.get("class") for cell in row] == ["num", "num span-fill"]
+
+
+def test_notes_filtered_per_chunk():
+    rows = ["<tr><td>甲</td><td>1</td></tr>", "<tr><td>乙[注2]</td><td>2</td></tr>"]
+    result = _rows_chunker(1).chunk(_build_html(rows, _NOTES_META))
+
+    assert len(result.chunks) == 2
+    first, second = (_context_text(chunk) for chunk in result.chunks)
+    assert "注1：单位为万元" in first and "注2" not in first
+    assert "注1：单位为万元" in second and "注2：仅适用于第二行" in second
+
+
+def test_notes_meta_script_not_copied_into_chunks():
+    result = _rows_chunker(8).chunk(_build_html(_same_rows(2), _NOTES_META))
+
+    assert "table-notes-meta" not in result.chunks[0]
+
+
+def test_by_rows_boundaries():
+    result = _rows_chunker(3).chunk(_build_html(_same_rows(7)))
+
+    assert [len(_body_rows(chunk)) for chunk in result.chunks] == [3, 3, 1]
+    assert result.stats.total_chunks == 3
+    assert not result.warnings
+
+
+def test_by_rows_exact_multiple_has_no_empty_chunk():
+    result = _rows_chunker(2).chunk(_build_html(_same_rows(4)))
+
+    assert [len(_body_rows(chunk)) for chunk in result.chunks] == [2, 2]
+
+
+def test_by_tokens_boundaries():
+    # 以 3 行整表的 token 数作为上限：恰好放得下 3 行，第 4 行必须切分
+    unlimited = HtmlChunker(ChunkConfig(max_tokens=None, max_rows=100))
+    limit = unlimited.chunk(_build_html(_same_rows(3))).stats.token_counts[0]
+
+    result = HtmlChunker(ChunkConfig(max_tokens=limit)).chunk(_build_html(_same_rows(7)))
+
+    assert [len(_body_rows(chunk)) for chunk in result.chunks] == [3, 3, 1]
+    assert max(result.stats.token_counts) == limit
+    assert not result.warnings
+
+
+def test_by_tokens_oversized_row_warns():
+    result = HtmlChunker(ChunkConfig(max_tokens=1)).chunk(_build_html(_same_rows(2)))
+
+    assert len(result.chunks) == 2
+    assert result.stats.oversized_chunks == 2
+    assert all(w.row_count == 1 for w in result.warnings)
+
+
+def _without_fast_path(monkeypatch) -> None:
+    """关闭整表单 chunk 快速路径，强制逐行切分"""
+    monkeypatch.setattr(HtmlChunker, "_fits_single_chunk", lambda _self, *_args: False)
+
+
+def _exact_token_config(html: str, **kwargs) -> ChunkConfig:
+    """max_tokens 恰好等于整表 token 数的配置"""
+    unlimited = HtmlChunker(ChunkConfig(max_tokens=None, max_rows=100))
+    return ChunkConfig(max_tokens=unlimited.chunk(html).stats.token_counts[0], **kwargs)
+
+
+@pytest.mark.parametrize(
+    "make_config",
+    [
+        lambda html: _exact_token_config(html),
+        lambda html: _exact_token_config(
+            html, min_tokens=1_000_000, token_strategy=TokenStrategy.PREFER_MIN
+        ),
+        lambda _html: ChunkConfig(split_mode=SplitMode.BY_ROWS, max_tokens=None, max_rows=4),
+    ],
+    ids=["max_tokens", "prefer_min_below_min_tokens", "max_rows"],
+)
+def test_exact_limit_single_chunk_matches_slow_path(monkeypatch, make_config):
+    html = _build_html(_same_rows(4), _NOTES_META)
+    config = make_config(html)
+    fast = HtmlChunker(config).chunk(html)
+    _without_fast_path(monkeypatch)
+    slow = HtmlChunker(config).chunk(html)
+
+    assert len(fast.chunks) == 1
+    assert fast.chunks == slow.chunks
+    assert fast.stats == slow.stats
+    assert not fast.warnings and not slow.warnings
+
+
+def test_prefer_min_splits_once_min_tokens_reached(monkeypatch):
+    html = _build_html(_same_rows(4))
+    limit = _exact_token_config(html).max_tokens
+    config = ChunkConfig(max_tokens=limit, min_tokens=1, token_strategy=TokenStrategy.PREFER_MIN)
+    fast = HtmlChunker(config).chunk(html)
+    _without_fast_path(monkeypatch)
+    slow = HtmlChunker(config).chunk(html)
+
+    assert [len(_body_rows(chunk)) for chunk in fast.chunks] == [1, 1, 1, 1]
+    assert fast.chunks == slow.chunks
+
+
+def test_str_and_bytes_input_match(sample_html_content: str):
+    chunker = _rows_chunker(1)
+    from_str = chunker.chunk(sample_html_content)
+    from_bytes = chunker.chunk(sample_html_content.encode("utf-8"))
+
+    assert from_str.chunks == from_bytes.chunks
+    assert from_str.stats == from_bytes.stats
+    assert len(from_str.chunks) == 2
+    assert "数据1" in from_str.chunks[0] and "数据3" in from_str.chunks[1]
+
+
+def test_str_and_bytes_input_match_with_notes():
+    html = _build_html(["<tr><td>乙[注2]</td><td>2</td></tr>"], _NOTES_META)
+    chunker = HtmlChunker(ChunkConfig())
+
+    assert chunker.chunk(html).chunks == chunker.chunk(html.encode("utf-8")).chunks
+
+
+def test_html_without_table_returns_input():
+    html = "<div>没有表格</div>"
+
+    assert HtmlChunker(ChunkConfig()).chunk(html.encode("utf-8")).chunks == [html]
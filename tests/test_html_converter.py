@@ -0,0 +1,76 @@
+"""
+ExcelToHtmlConverter 输出转义测试
+"""
+
+import json
+from pathlib import Path
+
+import openpyxl
+from lxml import etree
+
+from src.core.excel2html.converter import ExcelToHtmlConverter
+
+_NOTE = '注1：见 </script><script>alert("x")</script>'
+
+
+def _convert(tmp_path: Path, filename: str = "报表&<1>.xlsx") -> str:
+    """生成含特殊字符的工作簿并转换为 HTML"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'A&B<"x">'
+    sheet.append(["区7<b>", "值[注1]"])
+    sheet.append(["区7<b>", "a & b"])
+    for index in range(4):
+        sheet.append([f"行{index}", index])
+    # 前 5 行内的合并区域会被识别为多层表头，数据区的合并放在其后
+    # 末尾的整行合并会被识别为注释，合并行之后再放一行数据
+    sheet.append(["合并'单元格'", None])
+    sheet.append(["末行", 9])
+    sheet.append([_NOTE])
+    sheet.merge_cells("A7:B7")
+    source = tmp_path / filename
+    workbook.save(source)
+
+    converter = ExcelToHtmlConverter(keywords=["<税率>", "A&B"])
+    out_path = converter.convert(source, tmp_path / "out.html")
+    return out_path.read_text(encoding="utf-8")
+
+
+def test_header_and_data_cells_escaped(tmp_path: Path):
+    output = _convert(tmp_path)
+
+    assert "<th>区7&lt;b&gt;</th>" in output
+    assert "<td>区7&lt;b&gt;</td>" in output
+    assert "<td>a &amp; b</td>" in output
+    assert "<td colspan=\"2\">合并&#x27;单元格&#x27;</td>" in output
+    assert "<b>" not in output
+
+
+def test_table_attributes_caption_and_filename_escaped(tmp_path: Path):
+    output = _convert(tmp_path)
+
+    assert 'data-sheet="A&amp;B&lt;&quot;x&quot;&gt;"' in output
+    assert 'data-source="报表&amp;&lt;1&gt;.xlsx"' in output
+    assert "来源：报表&amp;&lt;1&gt;.xlsx |" in output
+    assert "<caption>关键检索词：&lt;税率&gt;，A&amp;B</caption>" in output
+
+
+def test_notes_meta_cannot_close_script(tmp_path: Path):
+    output = _convert(tmp_path)
+    root = etree.fromstring(output, etree.HTMLParser())
+    scripts = root.findall(".//script")
+
+    assert len(scripts) == 1
+    assert "</script><script>" not in output.split("<table", 1)[0]
+    assert "<\\/script>" in scripts[0].text
+    notes_meta = json.loads(scripts[0].text)
+    assert notes_meta["header_notes"] == {"注1": _NOTE}
+
+
+def test_html_safe_passes_plain_text_through():
+    converter = ExcelToHtmlConverter()
+
+    assert converter._html_safe("普通文本 123") == "普通文本 123"
+    assert converter._html_safe("<a href='x'>&</a>") == (
+        "&lt;a href=&#x27;x&#x27;&gt;&amp;&lt;/a&gt;"
+    )
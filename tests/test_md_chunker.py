@@ -0,0 +1,117 @@
+"""
+MarkdownChunker 解析测试
+"""
+
+import json
+
+import pytest
+
+from src.core.excel2md.chunker import MarkdownChunker
+from src.core.models import ChunkConfig
+
+_NOTES_META = {
+    "header_notes": {"注1": "注1：单位为万元"},
+    "conditional_notes": {"注2": "注2：仅适用于第二行"},
+}
+_NOTES_JSON = json.dumps(_NOTES_META, ensure_ascii=False)
+
+
+@pytest.fixture
+def chunker() -> MarkdownChunker:
+    """默认配置的 Markdown 切分器"""
+    return MarkdownChunker(ChunkConfig())
+
+
+def test_parse_front_matter(chunker: MarkdownChunker):
+    md = "\n".join(
+        [
+            "---",
+            "source: test.xlsx",
+            "sheet: Sheet1",
+            "keywords: 税率, 配额",
+            f"notes_meta: {_NOTES_JSON}",
+            "---",
+            "",
+            "| 列1 | 列2 |",
+            "| --- | --- |",
+            "| a | 1 |",
+        ]
+    )
+    front_matter, header, separator, data, header_notes, conditional_notes = (
+        chunker._parse_md_table(md)
+    )
+
+    assert front_matter["source"] == "test.xlsx"
+    assert front_matter["sheet"] == "Sheet1"
+    assert front_matter["keywords"] == "税率, 配额"
+    assert header_notes == _NOTES_META["header_notes"]
+    assert conditional_notes == _NOTES_META["conditional_notes"]
+    assert (header, separator, data) == ("| 列1 | 列2 |", "| --- | --- |", ["| a | 1 |"])
+
+
+def test_parse_without_front_matter(chunker: MarkdownChunker):
+    md = "| 列1 | 列2 |\n| --- | --- |\n| a | 1 |\n| b | 2 |"
+    front_matter, header, separator, data, header_notes, conditional_notes = (
+        chunker._parse_md_table(md)
+    )
+
+    assert front_matter == {}
+    assert header == "| 列1 | 列2 |"
+    assert separator == "| --- | --- |"
+    assert data == ["| a | 1 |", "| b | 2 |"]
+    assert header_notes == {} and conditional_notes == {}
+
+
+def test_parse_separator_not_directly_after_header(chunker: MarkdownChunker):
+    md = "| 列1 |\n| 说明行 |\n| --- |\n| a |"
+    _, header, separator, data, _, _ = chunker._parse_md_table(md)
+
+    assert header == "| 列1 |"
+    assert separator == "| --- |"
+    assert data == ["| 说明行 |", "| a |"]
+
+
+def test_parse_notes_comment_line(chunker: MarkdownChunker):
+    md = "\n".join(
+        [
+            f"<!-- NOTES_META: {_NOTES_JSON} -->",
+            "<!-- 普通注释 -->",
+            "| 列1 |",
+            "| --- |",
+            "| a[注2] |",
+        ]
+    )
+    _, header, _, data, header_notes, conditional_notes = chunker._parse_md_table(md)
+
+    assert header == "| 列1 |"
+    assert data == ["| a[注2] |"]
+    assert header_notes == _NOTES_META["header_notes"]
+    assert conditional_notes == _NOTES_META["conditional_notes"]
+
+
+def test_parse_invalid_notes_comment_ignored(chunker: MarkdownChunker):
+    md = "<!-- NOTES_META: {broken -->\n| 列1 |\n| --- |\n| a |"
+    _, _, _, data, header_notes, conditional_notes = chunker._parse_md_table(md)
+
+    assert data == ["| a |"]
+    assert header_notes == {} and conditional_notes == {}
+
+
+def test_table_without_data_rows(chunker: MarkdownChunker):
+    md = "---\nsource: test.xlsx\n---\n\n| 列1 | 列2 |\n| --- | --- |"
+    _, header, separator, data, _, _ = chunker._parse_md_table(md)
+
+    assert (header, separator, data) == ("| 列1 | 列2 |", "| --- | --- |", [])
+
+    result = chunker.chunk(md)
+    assert result.chunks == [md]
+    assert result.stats.total_chunks == 1
+
+
+def test_escaped_pipe_kept_in_cell(chunker: MarkdownChunker):
+    row = r"| a\|b | 1 |"
+    md = f"| 列1 | 列2 |\n| --- | --- |\n{row}"
+    _, _, _, data, _, _ = chunker._parse_md_table(md)
+
+    assert data == [row]
+    assert row in chunker.chunk(md).chunks[0]